@@ -1,17 +1,65 @@
-from flask import Flask, render_template, request, redirect, url_for, session, send_from_directory, jsonify
+from flask import Flask, render_template, request, redirect, url_for, session, send_from_directory, send_file, abort, jsonify, Response, stream_with_context, g, make_response
+from flask.json.provider import DefaultJSONProvider
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session as OrmSession
 from werkzeug.security import generate_password_hash, check_password_hash
+from jinja2 import FileSystemBytecodeCache, TemplateError
 import os
+import io
+import gc
+import re
+import csv
+import gzip
 import json
+import hashlib
+import tempfile
+import zipfile
 import random
+import shutil
+import sqlite3
 import string
+import time
+import copy
+import queue
+import itertools
+import threading
+import tracemalloc
+import atexit
+import logging
+import logging.handlers
+from collections import deque
 from datetime import datetime, timedelta
 from functools import wraps
 import smtplib
+import click
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
-app = Flask(__name__, template_folder='.', static_folder='.')
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# No static folder: the app directory also holds the database, uploads and
+# backups. Public files are served from assets/ by serve_assets().
+app = Flask(__name__, template_folder='.', static_folder=None)
 app.secret_key = 'super-secret-key-change-in-production'
 
 basedir = os.path.abspath(os.path.dirname(__file__))
@@ -19,8 +67,177 @@ db_path = os.path.join(basedir, 'database', 'certportal.db')
 app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Compiled templates are cached on disk and shared by all workers. Jinja keys
+# each entry by template name and checks a hash of the source, so an edited
+# template is recompiled automatically.
+TEMPLATE_CACHE_DIR = os.path.join(basedir, 'database', 'template_cache')
+os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+app.jinja_options = {**app.jinja_options, 'bytecode_cache': FileSystemBytecodeCache(TEMPLATE_CACHE_DIR)}
+
 db = SQLAlchemy(app)
 
+# WAL lets readers (including online backups) run alongside a writer instead
+# of blocking it. Turn it off if the database lives on a network filesystem,
+# where SQLite's shared-memory index does not work.
+SQLITE_WAL = True
+
+@event.listens_for(Engine, 'connect')
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    if SQLITE_WAL and isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.close()
+
+# ==================== LOGGING CONFIGURATION ====================
+# Request threads only put records on a bounded in-memory queue; a single
+# background listener thread formats them as JSON lines and writes them out.
+# When the sink is too slow and the queue fills up, records are dropped
+# instead of blocking the request. The number dropped is reported as a
+# `log_records_dropped` warning at most every LOG_DROP_REPORT_SECONDS, once
+# the queue accepts records again, and at exit.
+LOG_QUEUE_SIZE = 10000
+LOG_DROP_REPORT_SECONDS = 60
+LOG_LEVELS = {
+    'portal': 'INFO',
+    'portal.auth': 'INFO',
+    'portal.admin': 'INFO',
+    'portal.email': 'WARNING',
+}
+# Fraction of high-volume events that are kept (1.0 = log all, 0.1 = 10%).
+LOG_SAMPLE_RATES = {
+    'login_attempt': 0.1,
+    'login_success': 0.1,
+}
+
+_LOG_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+class JsonLineFormatter(logging.Formatter):
+    """Format a record as one JSON object per line; `extra` fields become keys"""
+    def format(self, record):
+        entry = {
+            'ts': datetime.utcfromtimestamp(record.created).strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+            'level': record.levelname,
+            'logger': record.name,
+            'event': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _LOG_RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of records whose event name is listed in `rates`"""
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        rate = self.rates.get(record.msg)
+        return rate is None or random.random() < rate
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of waiting when the queue is full"""
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.drop_lock = threading.Lock()
+        self.dropped = 0  # since the last report
+        self.dropped_total = 0
+        self.last_report = time.monotonic()
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self.drop_lock:
+                self.dropped += 1
+                self.dropped_total += 1
+            return
+        if self.dropped and time.monotonic() - self.last_report >= LOG_DROP_REPORT_SECONDS:
+            self.report_dropped()
+
+    def report_dropped(self):
+        """Queue a `log_records_dropped` warning for the records dropped since the last one"""
+        with self.drop_lock:
+            count, self.dropped = self.dropped, 0
+            total = self.dropped_total
+            self.last_report = time.monotonic()
+        if not count:
+            return
+        record = logging.LogRecord('portal', logging.WARNING, __file__, 0, 'log_records_dropped', None, None)
+        record.dropped = count
+        record.dropped_total = total
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self.drop_lock:
+                self.dropped += count
+
+    def prepare(self, record):
+        # Render the message and traceback here so the record is picklable and
+        # safe to hand to another thread, but keep them as separate fields.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+def configure_logging():
+    """Attach the queue handler to the `portal` loggers and start the listener"""
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    sink = logging.StreamHandler()
+    sink.setFormatter(JsonLineFormatter())
+    listener = logging.handlers.QueueListener(log_queue, sink, respect_handler_level=True)
+
+    handler = NonBlockingQueueHandler(log_queue)
+    handler.addFilter(SamplingFilter(LOG_SAMPLE_RATES))
+
+    root = logging.getLogger('portal')
+    root.handlers[:] = [handler]
+    root.propagate = False
+    for name, level in LOG_LEVELS.items():
+        logging.getLogger(name).setLevel(level)
+
+    listener.start()
+    atexit.register(listener.stop)
+    atexit.register(handler.report_dropped)  # runs before listener.stop
+    return listener
+
+log_listener = configure_logging()
+auth_log = logging.getLogger('portal.auth')
+admin_log = logging.getLogger('portal.admin')
+email_log = logging.getLogger('portal.email')
+
+# ==================== JSON PROVIDER ====================
+# jsonify() goes through app.json. When orjson is installed it replaces the
+# stdlib encoder; output is the same (sorted keys, Flask's date format).
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson"""
+    options = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME if orjson else 0
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self.options).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if self.compact is False or (self.compact is None and self._app.debug):
+            return super().response(obj)
+        return self._app.response_class(orjson.dumps(obj, default=self.default, option=self.options),
+                                        mimetype=self.mimetype)
+
+if orjson is not None:
+    app.json = OrjsonProvider(app)
+
 # ==================== EMAIL CONFIGURATION ====================
 SMTP_SERVER = "smtp.gmail.com"
 SMTP_PORT = 587
@@ -47,7 +264,7 @@ def send_email(recipient, subject, body, is_html=False):
         server.quit()
         return True
     except Exception as e:
-        print(f"Email error: {str(e)}")
+        email_log.error('email_failed', extra={'recipient': recipient, 'error': str(e)})
         return False
 
 # ==================== MODELS ====================
@@ -105,6 +322,8 @@ class Document(db.Model):
     doc_name = db.Column(db.String(200))
     download_link = db.Column(db.String(500), nullable=False)
     order = db.Column(db.Integer, default=0)
+    file_sha256 = db.Column(db.String(64))
+    file_name = db.Column(db.String(255))
 
 class CompanyDocument(db.Model):
     __tablename__ = 'company_document'
@@ -113,6 +332,27 @@ class CompanyDocument(db.Model):
     doc_type = db.Column(db.String(100), nullable=False)
     doc_name = db.Column(db.String(200))
     download_link = db.Column(db.String(500), nullable=False)
+    file_sha256 = db.Column(db.String(64))
+    file_name = db.Column(db.String(255))
+
+class CatalogChange(db.Model):
+    """Append-only log of catalog writes; `id` is the sync sequence number"""
+    __tablename__ = 'catalog_change'
+    __table_args__ = {'sqlite_autoincrement': True}
+    id = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(10), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class AdminEvent(db.Model):
+    """Events for the live admin stream, written by triggers; `id` is the SSE event id"""
+    __tablename__ = 'admin_event'
+    __table_args__ = {'sqlite_autoincrement': True}
+    id = db.Column(db.Integer, primary_key=True)
+    event = db.Column(db.String(50), nullable=False)
+    data = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class HomeNotification(db.Model):
     __tablename__ = 'home_notification'
@@ -124,6 +364,440 @@ class HomeNotification(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     order = db.Column(db.Integer, default=0)
 
+# ==================== CHANGE HOOKS ====================
+# Functions registered with @on_tables_changed run after any commit that
+# wrote to one of the given tables. Writes made with raw SQL are not seen by
+# the ORM and must call mark_tables_changed() before committing.
+_table_change_hooks = []
+
+def on_tables_changed(*tables):
+    """Register fn(changed_tables) to run after a commit touching `tables`"""
+    def decorator(fn):
+        _table_change_hooks.append((set(tables), fn))
+        return fn
+    return decorator
+
+def mark_tables_changed(*tables, session=None):
+    (session or db.session).info.setdefault('changed_tables', set()).update(tables)
+
+@event.listens_for(OrmSession, 'after_flush')
+def _collect_flushed_tables(session, flush_context):
+    tables = {obj.__table__.name for obj in itertools.chain(session.new, session.dirty, session.deleted)}
+    if tables:
+        mark_tables_changed(*tables, session=session)
+
+@event.listens_for(OrmSession, 'do_orm_execute')
+def _collect_bulk_tables(orm_execute_state):
+    if (orm_execute_state.is_update or orm_execute_state.is_delete) and orm_execute_state.bind_mapper:
+        mark_tables_changed(orm_execute_state.bind_mapper.local_table.name, session=orm_execute_state.session)
+
+@event.listens_for(OrmSession, 'after_commit')
+def _run_table_change_hooks(session):
+    changed = session.info.pop('changed_tables', None)
+    if not changed:
+        return
+    for tables, fn in _table_change_hooks:
+        if tables & changed:
+            try:
+                fn(changed)
+            except Exception:
+                logging.getLogger('portal').exception('change_hook_failed', extra={'hook': fn.__name__})
+
+@event.listens_for(OrmSession, 'after_rollback')
+def _discard_changed_tables(session):
+    session.info.pop('changed_tables', None)
+
+# ==================== DOCUMENT STORE ====================
+# Uploaded PDFs are stored under DOCUMENT_STORE_DIR named by their SHA-256,
+# so the same file uploaded twice is kept once. DOCUMENT_SENDFILE_MODE picks
+# how they are delivered:
+#   None         - Flask streams the file (the WSGI server's file_wrapper uses
+#                  sendfile() where available) and handles Range/ETag itself
+#   'x-sendfile' - Apache/lighttpd read the file from the X-Sendfile path
+#   'x-accel'    - nginx serves DOCUMENT_ACCEL_PREFIX + <relative path> from an
+#                  `internal` location that aliases DOCUMENT_STORE_DIR
+# When a commit deletes a document or replaces its PDF, the old file is
+# removed once no row references it any more. Files touched in the last
+# DOCUMENT_STORE_GRACE seconds are left alone, since an identical upload may be
+# about to reference them; `flask prune-document-store` sweeps those later.
+DOCUMENT_STORE_DIR = os.path.join(basedir, 'database', 'files')
+DOCUMENT_STORE_GRACE = 300
+DOCUMENT_SENDFILE_MODE = None
+DOCUMENT_ACCEL_PREFIX = '/protected-files/'
+DOCUMENT_MAX_AGE = 3600
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+app.config['USE_X_SENDFILE'] = DOCUMENT_SENDFILE_MODE == 'x-sendfile'
+
+def check_private_dir(path):
+    """Refuse to start if `path` would be reachable through a static file route"""
+    path = os.path.realpath(path)
+    for static_dir in filter(None, [app.static_folder] + [bp.static_folder for bp in app.blueprints.values()]):
+        static_dir = os.path.realpath(static_dir)
+        if os.path.commonpath([path, static_dir]) == static_dir:
+            raise RuntimeError(f"{path} is inside the static folder {static_dir} and would be served publicly")
+
+check_private_dir(DOCUMENT_STORE_DIR)
+
+def stored_file_relpath(sha256):
+    return os.path.join(sha256[:2], sha256)
+
+def stored_file_path(sha256):
+    return os.path.join(DOCUMENT_STORE_DIR, stored_file_relpath(sha256))
+
+def store_upload(upload):
+    """Save an uploaded PDF into the content-addressed store and return its SHA-256"""
+    if not upload.filename.lower().endswith('.pdf'):
+        raise ValueError('Only PDF files can be uploaded')
+    
+    os.makedirs(DOCUMENT_STORE_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=DOCUMENT_STORE_DIR, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            first = True
+            while True:
+                chunk = upload.stream.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if first and not chunk.startswith(b'%PDF-'):
+                    raise ValueError('Uploaded file is not a PDF')
+                first = False
+                digest.update(chunk)
+                out.write(chunk)
+        if first:
+            raise ValueError('Uploaded file is empty')
+        
+        sha256 = digest.hexdigest()
+        path = stored_file_path(sha256)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+            os.utime(path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        return sha256
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def serve_stored_file(sha256, download_name):
+    """Send a stored file with a strong ETag, conditional GET and byte ranges"""
+    path = stored_file_path(sha256)
+    if not os.path.isfile(path):
+        abort(404)
+    
+    if DOCUMENT_SENDFILE_MODE == 'x-accel':
+        response = Response(mimetype='application/pdf')
+        response.headers['X-Accel-Redirect'] = DOCUMENT_ACCEL_PREFIX + stored_file_relpath(sha256).replace(os.sep, '/')
+        response.headers['Content-Disposition'] = f'inline; filename="{download_name}"'
+        response.set_etag(sha256)
+        response.make_conditional(request)
+    else:
+        response = send_file(path, mimetype='application/pdf', download_name=download_name,
+                             etag=sha256, conditional=True, max_age=None)
+    
+    # Downloads require a login, so only the browser may cache them
+    response.cache_control.no_cache = None
+    response.cache_control.private = True
+    response.cache_control.max_age = DOCUMENT_MAX_AGE
+    return response
+
+def pdf_download_name(doc):
+    name = re.sub(r'[^\w\-. ]+', '_', doc.file_name or doc.doc_name or doc.doc_type, flags=re.ASCII).strip() or 'document'
+    return name if name.lower().endswith('.pdf') else name + '.pdf'
+
+def remove_unreferenced_files(candidates):
+    """Delete the stored files among `candidates` that no document references; returns the hashes removed"""
+    candidates = set(candidates)
+    if not candidates:
+        return []
+    with db.engine.connect() as conn:
+        in_use = set(conn.execute(db.union(
+            db.select(Document.file_sha256).where(Document.file_sha256.in_(candidates)),
+            db.select(CompanyDocument.file_sha256).where(CompanyDocument.file_sha256.in_(candidates)),
+        )).scalars())
+    
+    removed = []
+    cutoff = time.time() - DOCUMENT_STORE_GRACE
+    for sha256 in sorted(candidates - in_use):
+        path = stored_file_path(sha256)
+        try:
+            if os.path.getmtime(path) > cutoff:
+                continue
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        removed.append(sha256)
+    return removed
+
+@event.listens_for(OrmSession, 'after_flush')
+def _collect_released_files(session, flush_context):
+    released = set()
+    for obj in session.deleted:
+        if isinstance(obj, (Document, CompanyDocument)) and obj.file_sha256:
+            released.add(obj.file_sha256)
+    for obj in session.dirty:
+        if isinstance(obj, (Document, CompanyDocument)):
+            released.update(sha256 for sha256 in db.inspect(obj).attrs.file_sha256.history.deleted if sha256)
+    if released:
+        session.info.setdefault('released_files', set()).update(released)
+
+@event.listens_for(OrmSession, 'after_commit')
+def _remove_released_files(session):
+    released = session.info.pop('released_files', None)
+    if released:
+        try:
+            remove_unreferenced_files(released)
+        except Exception:
+            logging.getLogger('portal').exception('document_store_cleanup_failed')
+
+@event.listens_for(OrmSession, 'after_rollback')
+def _discard_released_files(session):
+    session.info.pop('released_files', None)
+
+@app.cli.command("prune-document-store")
+def prune_document_store_command():
+    """Delete stored PDFs that no document references."""
+    stored = set()
+    if os.path.isdir(DOCUMENT_STORE_DIR):
+        for root, dirs, files in os.walk(DOCUMENT_STORE_DIR):
+            stored.update(name for name in files if re.fullmatch(r'[0-9a-f]{64}', name))
+    removed = remove_unreferenced_files(stored)
+    print(f"✓ Removed {len(removed)} unreferenced file(s) from {DOCUMENT_STORE_DIR}")
+
+# ==================== ADMISSION CONTROL ====================
+# Each request belongs to a route class with its own per-worker concurrency
+# limit. A request waits at most the class's queue deadline for a free slot
+# (counting time already spent queued in the proxy, from X-Request-Start) and
+# is otherwise answered at once with 503 + Retry-After. A backlog of SQLite
+# writes or slow SMTP in the auth routes therefore can't take every thread,
+# and catalog reads and cheap pages keep working.
+ADMISSION_LIMITS = {
+    # route class: (max concurrent requests, max seconds to wait for a slot)
+    'auth': (8, 2.0),
+    'admin_write': (4, 5.0),
+    'catalog': (32, 1.0),
+    'static': (64, 0.5),
+}
+ADMISSION_RETRY_AFTER = 5
+
+AUTH_ENDPOINTS = {'login', 'register', 'forgot_password', 'verify_otp', 'reset_password', 'admin_login'}
+CATALOG_ENDPOINTS = {'portal', 'api_portal_data', 'api_search', 'api_notifications', 'download_document',
+                     'download_company_doc', 'download_product_bundle', 'download_company_bundle'}
+ADMIN_WRITE_ENDPOINTS = {'approve_user', 'reject_user'}
+# Long-lived streams are limited separately (SSE_MAX_STREAMS)
+ADMISSION_EXEMPT = {'admin_event_stream'}
+
+admission_log = logging.getLogger('portal.admission')
+_admission_slots = {name: threading.BoundedSemaphore(limit) for name, (limit, _) in ADMISSION_LIMITS.items()}
+
+def admission_class(endpoint, method):
+    """Route class for a request, or None if it is not limited"""
+    if endpoint is None or endpoint in ADMISSION_EXEMPT:
+        return None
+    if endpoint in AUTH_ENDPOINTS:
+        return 'auth'
+    if endpoint in CATALOG_ENDPOINTS:
+        return 'catalog'
+    if endpoint in ADMIN_WRITE_ENDPOINTS or (request.path.startswith('/admin') and method != 'GET'):
+        return 'admin_write'
+    if request.path.startswith('/admin'):
+        return None
+    return 'static'
+
+def proxy_queue_seconds():
+    """Time spent waiting in front of the app, from an X-Request-Start: t=<epoch> header"""
+    header = request.headers.get('X-Request-Start', '')
+    try:
+        started = float(header.removeprefix('t='))
+    except ValueError:
+        return 0.0
+    if started > 1e11:  # milliseconds
+        started /= 1000
+    return max(0.0, time.time() - started)
+
+def shed_response(route_class):
+    headers = {'Retry-After': str(ADMISSION_RETRY_AFTER)}
+    if request.method != 'GET' or request.path.startswith('/api'):
+        return jsonify({'success': False, 'error': 'Server busy, please retry shortly'}), 503, headers
+    return """
+    <style>body{font-family:Arial;padding:40px;background:#f7fafc}</style>
+    <div style="max-width:600px;margin:0 auto;background:white;padding:30px;border-radius:10px;box-shadow:0 2px 10px rgba(0,0,0,0.1)">
+        <h2 style="color:#ed8936">⏳ Server Busy</h2>
+        <p>We're handling a lot of requests right now. Please try again in a few seconds.</p>
+    </div>
+    """, 503, headers
+
+@app.before_request
+def admit_request():
+    route_class = admission_class(request.endpoint, request.method)
+    if route_class is None:
+        return None
+    
+    limit, deadline = ADMISSION_LIMITS[route_class]
+    remaining = deadline - proxy_queue_seconds()
+    if remaining <= 0 or not _admission_slots[route_class].acquire(timeout=remaining):
+        admission_log.warning('request_shed', extra={'route_class': route_class, 'endpoint': request.endpoint})
+        return shed_response(route_class)
+    g.admission_class = route_class
+
+@app.teardown_request
+def release_admission(exc):
+    route_class = g.pop('admission_class', None)
+    if route_class is not None:
+        _admission_slots[route_class].release()
+
+# ==================== SINGLE FLIGHT ====================
+# Expensive read builders go through SingleFlight.get(). Only one
+# computation per key runs at a time: other threads in the worker wait for
+# its result, and other workers wait on a lock file in SINGLE_FLIGHT_DIR and
+# then read the result from the shared cache file next to it. Results are
+# cached under a version (e.g. the catalog change sequence) and/or a TTL.
+# A caller that already has an older result gets that instead when another
+# worker is refreshing the key, or when the refresh overruns the timeout
+# (stale-while-revalidate). A caller with nothing to fall back on never
+# computes the value itself; it gets SingleFlightTimeout, which is answered
+# with a 503 like any other shed request.
+SINGLE_FLIGHT_DIR = os.path.join(basedir, 'database', 'flight')
+SINGLE_FLIGHT_TIMEOUT = 10.0
+
+flight_log = logging.getLogger('portal.flight')
+
+def acquire_file_lock(path, timeout=0):
+    """Take an exclusive lock on `path`, waiting up to `timeout` seconds; returns a handle or None"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    handle = open(path, 'a')
+    if fcntl is None:
+        return handle
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return handle
+        except BlockingIOError:
+            if time.monotonic() >= deadline:
+                handle.close()
+                return None
+            time.sleep(0.01)
+
+def release_file_lock(handle):
+    if fcntl is not None:
+        fcntl.flock(handle, fcntl.LOCK_UN)
+    handle.close()
+
+class SingleFlightTimeout(Exception):
+    pass
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.entry = None
+        self.served_stale = False
+        self.error = None
+
+class SingleFlight:
+    """Per-key request coalescing with worker-local and shared file caches; values must be JSON-serializable"""
+    
+    def __init__(self, directory, timeout=SINGLE_FLIGHT_TIMEOUT):
+        self.directory = directory
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.flights = {}
+        self.cache = {}  # key -> (version, stored_at, value)
+    
+    def get(self, key, compute, version=None, ttl=None):
+        """Cached value of `key` for `version`, computing it at most once across threads and workers"""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self.lock:
+                stale = self.cache.get(key)
+                if self._fresh(stale, version, ttl):
+                    return stale[2]
+                flight = self.flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self.flights[key] = _Flight()
+            if leader:
+                break
+            
+            if not flight.done.wait(max(0.0, deadline - time.monotonic())):
+                if stale is not None:
+                    flight_log.warning('single_flight_stale', extra={'key': key})
+                    return stale[2]
+                flight_log.warning('single_flight_timeout', extra={'key': key})
+                raise SingleFlightTimeout(key)
+            if flight.error is not None:
+                if stale is not None:
+                    return stale[2]
+                raise flight.error
+            if flight.entry[0] == version or flight.served_stale:
+                return flight.entry[2]
+            # That flight computed an older version; wait for (or lead) the next one
+        
+        try:
+            flight.entry, flight.served_stale = self._lead(key, compute, version, ttl, stale)
+            return flight.entry[2]
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+    
+    def _lead(self, key, compute, version, ttl, stale):
+        lock_path = self._path(key, '.lock')
+        handle = acquire_file_lock(lock_path)
+        if handle is None:
+            if stale is not None:
+                return stale, True  # another worker is refreshing it
+            handle = acquire_file_lock(lock_path, self.timeout)
+            if handle is None:
+                flight_log.warning('single_flight_timeout', extra={'key': key})
+                raise SingleFlightTimeout(key)
+        try:
+            entry = self._read_shared(key)
+            if not self._fresh(entry, version, ttl):
+                entry = (version, time.time(), compute())
+                self._write_shared(key, entry)
+        finally:
+            release_file_lock(handle)
+        with self.lock:
+            self.cache[key] = entry
+        return entry, False
+    
+    def _fresh(self, entry, version, ttl):
+        return entry is not None and entry[0] == version and (ttl is None or time.time() - entry[1] < ttl)
+    
+    def _path(self, key, suffix):
+        return os.path.join(self.directory, re.sub(r'[^\w.-]', '_', key) + suffix)
+    
+    def _read_shared(self, key):
+        try:
+            with open(self._path(key, '.json'), 'rb') as f:
+                entry = json.loads(f.read())
+            return entry['version'], entry['stored_at'], entry['value']
+        except (OSError, ValueError, KeyError):
+            return None
+    
+    def _write_shared(self, key, entry):
+        path = self._path(key, '.json')
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({'version': entry[0], 'stored_at': entry[1], 'value': entry[2]}, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            flight_log.exception('single_flight_write_failed', extra={'key': key})
+
+single_flight = SingleFlight(SINGLE_FLIGHT_DIR)
+
+@app.errorhandler(SingleFlightTimeout)
+def single_flight_busy(e):
+    return shed_response(admission_class(request.endpoint, request.method))
+
 # ==================== ROUTES ====================
 @app.route('/assets/<path:filename>')
 def serve_assets(filename):
@@ -144,17 +818,34 @@ def contact():
     """Contact page with company information"""
     return render_template("contact.html")
 
+# With PORTAL_INLINE_DATA the cached catalog JSON is embedded in the portal
+# page, so it renders without waiting for a second request to
+# /api/portal-data (which the page still uses for refreshes).
+PORTAL_INLINE_DATA = True
+
+def script_safe_json(text):
+    """Escape serialized JSON for embedding in a <script> element"""
+    return text.replace('<', '\\u003c').replace('>', '\\u003e').replace('&', '\\u0026')
+
 @app.route("/portal")
 def portal():
     is_logged_in = "user_id" in session
     user_name = session.get("user_name", "")
-    return render_template("portal_new.html", is_logged_in=is_logged_in, user_name=user_name)
+    portal_data = script_safe_json(portal_data_json(is_logged_in)) if PORTAL_INLINE_DATA else None
+    response = make_response(render_template("portal_new.html", is_logged_in=is_logged_in, user_name=user_name,
+                                             portal_data=portal_data))
+    if portal_data is None:
+        # Proxies that support Early Hints turn this into a 103 response
+        response.headers['Link'] = '</api/portal-data>; rel=preload; as=fetch; crossorigin'
+    return response
 
 @app.route("/download/<int:doc_id>")
 def download_document(doc_id):
     if "user_id" not in session:
         return redirect(url_for("login", next=request.url))
     doc = Document.query.get_or_404(doc_id)
+    if doc.file_sha256:
+        return serve_stored_file(doc.file_sha256, pdf_download_name(doc))
     return redirect(doc.download_link)
 
 @app.route("/download/company/<int:doc_id>")
@@ -162,57 +853,264 @@ def download_company_doc(doc_id):
     if "user_id" not in session:
         return redirect(url_for("login", next=request.url))
     doc = CompanyDocument.query.get_or_404(doc_id)
+    if doc.file_sha256:
+        return serve_stored_file(doc.file_sha256, pdf_download_name(doc))
     return redirect(doc.download_link)
 
 @app.route("/api/portal-data")
 def api_portal_data():
-    categories = ProductCategory.query.order_by(ProductCategory.order).all()
-    company_docs = CompanyDocument.query.all()
+    """Full catalog, or only the changes after ?since=<seq> while the change log covers it"""
     is_logged_in = "user_id" in session
+    since = request.args.get("since", type=int)
+    
+    if since is not None:
+        delta = build_portal_delta(since, is_logged_in)
+        if delta is not None:
+            return jsonify(delta)
+    
+    return app.response_class(portal_data_json(is_logged_in), mimetype=app.json.mimetype)
+
+def portal_data_json(is_logged_in):
+    """Serialized full catalog for one login state, built once per catalog change"""
+    seq = current_catalog_seq()
+    
+    def build():
+        data = build_portal_data(is_logged_in)
+        data['seq'] = seq
+        data['full'] = True
+        return app.json.dumps(data)
+    
+    return single_flight.get(f"portal-data-{int(is_logged_in)}", build, version=seq)
+
+# ==================== READ-ONLY QUERIES ====================
+# The public read endpoints select plain columns with Core statements and
+# build their JSON from the row tuples directly: no ORM instances, identity
+# map or attribute instrumentation, and one query per table instead of one
+# per category and product.
+category_table = ProductCategory.__table__
+product_table = Product.__table__
+document_table = Document.__table__
+company_document_table = CompanyDocument.__table__
+notification_table = HomeNotification.__table__
+
+def build_portal_data(is_logged_in):
+    """Build the complete catalog tree served by /api/portal-data"""
+    c, p, d, cd = category_table.c, product_table.c, document_table.c, company_document_table.c
+    execute = db.session.execute
     
     company_data = {}
-    for doc in company_docs:
-        if doc.location not in company_data:
-            company_data[doc.location] = []
-        company_data[doc.location].append({
-            'id': doc.id,
-            'type': doc.doc_type,
-            'name': doc.doc_name or doc.doc_type,
-            'link': f'/download/company/{doc.id}' if is_logged_in else '/login',
+    for doc_id, location, doc_type, doc_name in execute(
+            db.select(cd.id, cd.location, cd.doc_type, cd.doc_name).order_by(cd.id)):
+        company_data.setdefault(location, []).append({
+            'id': doc_id,
+            'type': doc_type,
+            'name': doc_name or doc_type,
+            'link': f'/download/company/{doc_id}' if is_logged_in else '/login',
             'requires_login': not is_logged_in
         })
     
-    products_data = []
-    for cat in categories:
-        products = Product.query.filter_by(category_id=cat.id).order_by(Product.order).all()
-        products_list = []
-        for prod in products:
-            docs = Document.query.filter_by(product_id=prod.id).order_by(Document.order).all()
-            products_list.append({
-                'id': prod.id,
-                'wattage': prod.wattage,
-                'availability': prod.availability,
-                'documents': [{
-                    'id': d.id,
-                    'type': d.doc_type,
-                    'name': d.doc_name or d.doc_type,
-                    'link': f'/download/{d.id}' if is_logged_in else '/login',
-                    'requires_login': not is_logged_in
-                } for d in docs]
-            })
-        
-        products_data.append({
-            'id': cat.id,
-            'name': cat.name,
-            'description': cat.description,
-            'products': products_list
+    docs_by_product = {}
+    for doc_id, product_id, doc_type, doc_name in execute(
+            db.select(d.id, d.product_id, d.doc_type, d.doc_name).order_by(d.order, d.id)):
+        docs_by_product.setdefault(product_id, []).append({
+            'id': doc_id,
+            'type': doc_type,
+            'name': doc_name or doc_type,
+            'link': f'/download/{doc_id}' if is_logged_in else '/login',
+            'requires_login': not is_logged_in
         })
     
-    return jsonify({
+    products_by_category = {}
+    for product_id, category_id, wattage, availability in execute(
+            db.select(p.id, p.category_id, p.wattage, p.availability).order_by(p.order, p.id)):
+        products_by_category.setdefault(category_id, []).append({
+            'id': product_id,
+            'wattage': wattage,
+            'availability': availability,
+            'documents': docs_by_product.get(product_id, [])
+        })
+    
+    products_data = [{
+        'id': category_id,
+        'name': name,
+        'description': description,
+        'products': products_by_category.get(category_id, [])
+    } for category_id, name, description in execute(
+        db.select(c.id, c.name, c.description).order_by(c.order, c.id))]
+    
+    return {
         'companyDocs': company_data,
         'categories': products_data,
         'isLoggedIn': is_logged_in
-    })
+    }
+
+def fetch_active_notifications():
+    """Active homepage notifications as the dicts served by /api/notifications"""
+    n = notification_table.c
+    rows = db.session.execute(
+        db.select(n.id, n.title, n.description, n.notification_type)
+        .where(n.is_active == True)
+        .order_by(n.order)
+    )
+    return [{
+        'id': notif_id,
+        'title': title,
+        'description': description,
+        'type': notification_type
+    } for notif_id, title, description, notification_type in rows]
+
+# ==================== DOCUMENT BUNDLES ====================
+# A bundle is a ZIP of every locally stored document for a product or a
+# company location, generated entry by entry while it is being sent. Files
+# that are already compressed are stored as-is rather than deflated again.
+# Documents that only have an external link are listed in LINKS.txt.
+# Finished bundles are kept in BUNDLE_CACHE_DIR, keyed by a hash of their
+# contents, so repeat downloads are served straight from disk and any catalog
+# change naturally produces a new key.
+BUNDLE_CACHE_DIR = os.path.join(basedir, 'database', 'bundles')
+BUNDLE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+PRECOMPRESSED_EXTENSIONS = ('.pdf', '.zip', '.gz', '.jpg', '.jpeg', '.png')
+
+class ZipChunkSink(io.RawIOBase):
+    """Write-only, unseekable target that collects zipfile output for streaming"""
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+def bundle_entries(docs):
+    """Split documents into (arcname, path) file entries and external links"""
+    files, links, seen = [], [], set()
+    for doc in docs:
+        if doc.file_sha256 and os.path.isfile(stored_file_path(doc.file_sha256)):
+            name = pdf_download_name(doc)
+            base, ext = os.path.splitext(name)
+            n = 2
+            while name in seen:
+                name = f"{base} ({n}){ext}"
+                n += 1
+            seen.add(name)
+            files.append((name, doc.file_sha256))
+        elif doc.download_link:
+            links.append((doc.doc_name or doc.doc_type, doc.download_link))
+    return files, links
+
+def bundle_cache_key(files, links):
+    payload = json.dumps([files, links], ensure_ascii=False).encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()[:32]
+
+def prune_bundle_cache():
+    """Remove the least recently written bundles above BUNDLE_CACHE_MAX_BYTES"""
+    bundles = []
+    for entry in os.scandir(BUNDLE_CACHE_DIR):
+        if entry.name.endswith('.zip'):
+            stat = entry.stat()
+            bundles.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in bundles)
+    for _, size, path in sorted(bundles):
+        if total <= BUNDLE_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+
+def generate_bundle(files, links, cache_path):
+    """Yield the ZIP archive chunk by chunk, saving a copy to `cache_path`"""
+    os.makedirs(BUNDLE_CACHE_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=BUNDLE_CACHE_DIR, suffix='.part')
+    cache = os.fdopen(fd, 'wb')
+    sink = ZipChunkSink()
+    
+    def flush():
+        data = sink.drain()
+        if data:
+            cache.write(data)
+        return data
+    
+    try:
+        with zipfile.ZipFile(sink, 'w') as archive:
+            for name, sha256 in files:
+                path = stored_file_path(sha256)
+                info = zipfile.ZipInfo(name, date_time=time.localtime(os.path.getmtime(path))[:6])
+                info.compress_type = (zipfile.ZIP_STORED if name.lower().endswith(PRECOMPRESSED_EXTENSIONS)
+                                      else zipfile.ZIP_DEFLATED)
+                force_zip64 = os.path.getsize(path) > zipfile.ZIP64_LIMIT
+                with open(path, 'rb') as src, archive.open(info, 'w', force_zip64=force_zip64) as dest:
+                    while True:
+                        chunk = src.read(UPLOAD_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        dest.write(chunk)
+                        data = flush()
+                        if data:
+                            yield data
+            if links:
+                lines = ['Documents available online:', ''] + [f"{name}: {link}" for name, link in links]
+                archive.writestr('LINKS.txt', '\r\n'.join(lines) + '\r\n', compress_type=zipfile.ZIP_DEFLATED)
+        data = flush()
+        if data:
+            yield data
+        cache.close()
+        os.replace(tmp_path, cache_path)
+        prune_bundle_cache()
+    finally:
+        # Client went away or something failed: drop the partial copy
+        if not cache.closed:
+            cache.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def bundle_response(docs, download_name):
+    files, links = bundle_entries(docs)
+    if not files and not links:
+        abort(404)
+    
+    key = bundle_cache_key(files, links)
+    cache_path = os.path.join(BUNDLE_CACHE_DIR, f"{key}.zip")
+    if os.path.isfile(cache_path):
+        response = send_file(cache_path, mimetype='application/zip', as_attachment=True,
+                             download_name=download_name, etag=key, conditional=True, max_age=None)
+    else:
+        response = Response(stream_with_context(generate_bundle(files, links, cache_path)),
+                            mimetype='application/zip',
+                            headers={'Content-Disposition': f'attachment; filename="{download_name}"',
+                                     'X-Accel-Buffering': 'no'})
+        response.set_etag(key)
+    response.cache_control.no_cache = None
+    response.cache_control.private = True
+    return response
+
+def bundle_name(*parts):
+    name = re.sub(r'[^\w\-. ]+', '_', ' '.join(parts), flags=re.ASCII).strip()
+    return (name or 'documents') + '.zip'
+
+@app.route("/download/product/<int:prod_id>/bundle")
+def download_product_bundle(prod_id):
+    if "user_id" not in session:
+        return redirect(url_for("login", next=request.url))
+    product = Product.query.get_or_404(prod_id)
+    docs = Document.query.filter_by(product_id=product.id).order_by(Document.order).all()
+    return bundle_response(docs, bundle_name(product.category.name, product.wattage))
+
+@app.route("/download/company/<location>/bundle")
+def download_company_bundle(location):
+    if "user_id" not in session:
+        return redirect(url_for("login", next=request.url))
+    docs = CompanyDocument.query.filter_by(location=location).order_by(CompanyDocument.id).all()
+    return bundle_response(docs, bundle_name(location))
 
 # ==================== PASSWORD RESET ROUTES ====================
 def generate_otp():
@@ -329,10 +1227,7 @@ def register():
         company = request.form.get("company", "").strip()
         mobile = request.form.get("mobile", "").strip()
         
-        print(f"\n📝 Registration attempt:")
-        print(f"   Email: {email}")
-        print(f"   Name: {name}")
-        print(f"   Company: {company}")
+        auth_log.info('registration_attempt', extra={'email': email, 'user_name': name, 'company': company})
         
         if not email or not password or not name:
             return """
@@ -382,10 +1277,7 @@ def register():
             db.session.add(user)
             db.session.commit()
             
-            print(f"✅ User created successfully:")
-            print(f"   ID: {user.id}")
-            print(f"   Email: {user.email}")
-            print(f"   Approved: {user.approved}")
+            auth_log.info('user_created', extra={'user_id': user.id, 'email': user.email, 'approved': user.approved})
             
             try:
                 access_req = AccessRequest(
@@ -396,9 +1288,8 @@ def register():
                 )
                 db.session.add(access_req)
                 db.session.commit()
-                print(f"   ✓ Access request created")
             except Exception as e:
-                print(f"   ⚠️ Access request failed: {e}")
+                auth_log.warning('access_request_failed', extra={'user_id': user.id, 'error': str(e)})
             
             try:
                 admin_subject = "📋 New User Registration - Gautam Solar Portal"
@@ -422,9 +1313,8 @@ def register():
                 </div>
                 """
                 send_email(ADMIN_EMAIL, admin_subject, admin_body, is_html=True)
-                print(f"   ✓ Admin notification email sent")
             except Exception as e:
-                print(f"   ⚠️ Email notification failed: {e}")
+                auth_log.warning('registration_email_failed', extra={'user_id': user.id, 'error': str(e)})
             
             return f"""
             <style>
@@ -490,9 +1380,7 @@ def register():
         
         except Exception as e:
             db.session.rollback()
-            print(f"❌ Registration error: {e}")
-            import traceback
-            traceback.print_exc()
+            auth_log.exception('registration_failed', extra={'email': email})
             return f"""
             <style>body{{font-family:Arial;padding:40px;background:#f7fafc}}</style>
             <div style="max-width:600px;margin:0 auto;background:white;padding:30px;border-radius:10px">
@@ -512,12 +1400,12 @@ def login():
         email = request.form.get("email", "").strip()
         password = request.form.get("password", "")
         
-        print(f"\n🔐 Login attempt: {email}")
+        auth_log.info('login_attempt', extra={'email': email, 'remote_addr': request.remote_addr})
         
         user = User.query.filter_by(email=email).first()
         
         if not user:
-            print(f"   ❌ User not found: {email}")
+            auth_log.info('login_failed', extra={'email': email, 'reason': 'unknown_email'})
             return """
             <style>body{font-family:Arial;padding:40px;background:#f7fafc}</style>
             <div style="max-width:600px;margin:0 auto;background:white;padding:30px;border-radius:10px;box-shadow:0 2px 10px rgba(0,0,0,0.1)">
@@ -529,10 +1417,8 @@ def login():
             </div>
             """
         
-        print(f"   User found: ID={user.id}, Approved={user.approved}")
-        
         if not check_password_hash(user.password, password):
-            print(f"   ❌ Wrong password for: {email}")
+            auth_log.info('login_failed', extra={'email': email, 'user_id': user.id, 'reason': 'bad_password'})
             return """
             <style>body{font-family:Arial;padding:40px;background:#f7fafc}</style>
             <div style="max-width:600px;margin:0 auto;background:white;padding:30px;border-radius:10px;box-shadow:0 2px 10px rgba(0,0,0,0.1)">
@@ -545,7 +1431,7 @@ def login():
             """
         
         if not user.approved:
-            print(f"   ⏳ Account pending approval: {email}")
+            auth_log.info('login_failed', extra={'email': email, 'user_id': user.id, 'reason': 'pending_approval'})
             return """
             <style>
                 body {
@@ -573,7 +1459,7 @@ def login():
             </div>
             """
         
-        print(f"   ✅ Login successful: {email}")
+        auth_log.info('login_success', extra={'email': email, 'user_id': user.id})
         session["user_id"] = user.id
         session["user_name"] = user.name
         
@@ -586,14 +1472,12 @@ def login():
             db.session.add(access_req)
             db.session.commit()
         except Exception as e:
-            print(f"   ⚠️ Could not log access: {e}")
+            auth_log.warning('access_log_failed', extra={'user_id': user.id, 'error': str(e)})
         
         next_url = request.args.get('next')
         if next_url:
-            print(f"   → Redirecting to: {next_url}")
             return redirect(next_url)
         
-        print(f"   → Redirecting to portal")
         return redirect(url_for("portal"))
     
     return render_template("login.html")
@@ -625,18 +1509,29 @@ def admin_dashboard():
     if "admin" not in session:
         return redirect(url_for("admin_login"))
     
-    users_count = User.query.count()
-    approved_count = User.query.filter_by(approved=True).count()
-    categories_count = ProductCategory.query.count()
-    products_count = Product.query.count()
-    pending_requests = AccessRequest.query.filter_by(notified=False).count()
-    
+    counts = cached_dashboard_counts()
     return render_template("admin_dashboard.html", 
-                         users_count=users_count,
-                         approved_count=approved_count,
-                         categories_count=categories_count,
-                         products_count=products_count,
-                         pending_requests=pending_requests)
+                         users_count=counts['users'],
+                         approved_count=counts['approved'],
+                         categories_count=counts['categories'],
+                         products_count=counts['products'],
+                         pending_requests=counts['pending'])
+
+def dashboard_counts():
+    """Counts shown on the admin dashboard and pushed to its live stream"""
+    return {
+        'users': User.query.count(),
+        'approved': User.query.filter_by(approved=True).count(),
+        'categories': ProductCategory.query.count(),
+        'products': Product.query.count(),
+        'pending': AccessRequest.query.filter_by(notified=False).count()
+    }
+
+DASHBOARD_COUNTS_TTL = 5
+
+def cached_dashboard_counts():
+    """dashboard_counts() shared by all admins for DASHBOARD_COUNTS_TTL seconds"""
+    return single_flight.get('dashboard-counts', dashboard_counts, ttl=DASHBOARD_COUNTS_TTL)
 
 @app.route("/admin/users")
 def admin_users():
@@ -655,7 +1550,7 @@ def approve_user(user_id):
         user.approved = True
         db.session.commit()
         
-        print(f"✅ User approved: {user.email}")
+        admin_log.info('user_approved', extra={'user_id': user.id, 'email': user.email})
         
         try:
             AccessRequest.query.filter_by(user_id=user.id, request_type='new_registration', notified=False).update({'notified': True})
@@ -694,14 +1589,13 @@ def approve_user(user_id):
                 """,
                 is_html=True
             )
-            print(f"   ✓ Approval email sent to {user.email}")
         except Exception as e:
-            print(f"   ⚠️ Could not send approval email: {e}")
+            admin_log.warning('approval_email_failed', extra={'user_id': user.id, 'error': str(e)})
         
         return redirect(url_for("admin_users"))
     
     except Exception as e:
-        print(f"❌ Error approving user: {e}")
+        admin_log.exception('approve_failed', extra={'user_id': user_id})
         return f"Error approving user: {str(e)}"
 
 @app.route("/admin/reject/<int:user_id>")
@@ -717,7 +1611,7 @@ def reject_user(user_id):
         db.session.delete(user)
         db.session.commit()
         
-        print(f"❌ User rejected and deleted: {email}")
+        admin_log.info('user_rejected', extra={'user_id': user_id, 'email': email})
         
         try:
             send_email(
@@ -744,12 +1638,12 @@ def reject_user(user_id):
                 is_html=True
             )
         except Exception as e:
-            print(f"   ⚠️ Could not send rejection email: {e}")
+            admin_log.warning('rejection_email_failed', extra={'user_id': user_id, 'error': str(e)})
         
         return redirect(url_for("admin_users"))
     
     except Exception as e:
-        print(f"❌ Error rejecting user: {e}")
+        admin_log.exception('reject_failed', extra={'user_id': user_id})
         return f"Error rejecting user: {str(e)}"
 
 @app.route("/admin/certificates")
@@ -844,22 +1738,30 @@ def add_document():
         product_id = int(request.form.get("product_id"))
         doc_type = request.form.get("doc_type")
         doc_name = request.form.get("doc_name", "")
-        download_link = request.form.get("download_link")
+        download_link = request.form.get("download_link", "")
+        upload = request.files.get("file")
         order = int(request.form.get("order", 0))
         
-        if not doc_type or not download_link:
-            return jsonify({'success': False, 'error': 'Document type and link are required'})
+        if not doc_type or not (download_link or (upload and upload.filename)):
+            return jsonify({'success': False, 'error': 'Document type and a link or PDF file are required'})
         
         if doc_type.lower() == "other" and doc_name:
             doc_type = doc_name
             doc_name = ""
         
+        file_sha256 = file_name = None
+        if upload and upload.filename:
+            file_sha256 = store_upload(upload)
+            file_name = upload.filename
+        
         document = Document(
             product_id=product_id,
             doc_type=doc_type,
             doc_name=doc_name,
             download_link=download_link,
-            order=order
+            order=order,
+            file_sha256=file_sha256,
+            file_name=file_name
         )
         db.session.add(document)
         db.session.commit()
@@ -900,16 +1802,23 @@ def add_company_doc():
         location = request.form.get("location")
         doc_type = request.form.get("doc_type")
         doc_name = request.form.get("doc_name", "")
-        download_link = request.form.get("download_link")
+        download_link = request.form.get("download_link", "")
+        upload = request.files.get("file")
         
-        if not location or not doc_type or not download_link:
+        if not location or not doc_type or not (download_link or (upload and upload.filename)):
             return jsonify({'success': False, 'error': 'All fields are required'})
         
         if doc_type.lower() == "other" and doc_name:
             doc_type = doc_name
             doc_name = ""
         
-        doc = CompanyDocument(location=location, doc_type=doc_type, doc_name=doc_name, download_link=download_link)
+        file_sha256 = file_name = None
+        if upload and upload.filename:
+            file_sha256 = store_upload(upload)
+            file_name = upload.filename
+        
+        doc = CompanyDocument(location=location, doc_type=doc_type, doc_name=doc_name, download_link=download_link,
+                              file_sha256=file_sha256, file_name=file_name)
         db.session.add(doc)
         db.session.commit()
         
@@ -932,21 +1841,698 @@ def delete_company_doc(doc_id):
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)})
 
+# ==================== CATALOG UPDATES ====================
+# Update endpoints accept POST or PATCH with form data or a JSON object and
+# change only the fields that were sent, so items keep their ids (and their
+# products and documents) when edited.
+PRODUCT_AVAILABILITY = ('available', 'limited')
+
+def update_data():
+    """Fields sent with an update request, as JSON or form data"""
+    return request.get_json(silent=True) or request.form
+
+def apply_updates(obj, data, fields):
+    """Copy the fields present in `data` onto `obj`; `fields` maps name -> converter"""
+    for name, convert in fields.items():
+        if name in data:
+            try:
+                setattr(obj, name, convert(data[name]))
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"Invalid {name}: {e}")
+
+def required_text(value):
+    value = str(value or '').strip()
+    if not value:
+        raise ValueError("must not be empty")
+    return value
+
+def optional_text(value):
+    return str(value or '').strip()
+
+def availability_value(value):
+    if value not in PRODUCT_AVAILABILITY:
+        raise ValueError(f"must be one of {', '.join(PRODUCT_AVAILABILITY)}")
+    return value
+
+def existing_id(model):
+    def convert(value):
+        if db.session.get(model, int(value)) is None:
+            raise ValueError(f"no {model.__tablename__} with id {value}")
+        return int(value)
+    return convert
+
+def apply_document_updates(doc, data):
+    """Shared doc_type / link / file handling for product and company documents"""
+    apply_updates(doc, data, {'doc_type': required_text, 'doc_name': optional_text, 'download_link': optional_text})
+    if doc.doc_type.lower() == "other" and doc.doc_name:
+        doc.doc_type = doc.doc_name
+        doc.doc_name = ""
+    
+    upload = request.files.get("file")
+    if upload and upload.filename:
+        doc.file_sha256 = store_upload(upload)
+        doc.file_name = upload.filename
+    
+    if not doc.download_link and not doc.file_sha256:
+        raise ValueError("A link or PDF file is required")
+
+@app.route("/admin/category/<int:cat_id>/update", methods=["POST", "PATCH"])
+def update_category(cat_id):
+    if "admin" not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    
+    try:
+        category = ProductCategory.query.get_or_404(cat_id)
+        apply_updates(category, update_data(), {'name': required_text, 'description': optional_text, 'order': int})
+        db.session.commit()
+        return jsonify({'success': True})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route("/admin/product/<int:prod_id>/update", methods=["POST", "PATCH"])
+def update_product(prod_id):
+    if "admin" not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    
+    try:
+        product = Product.query.get_or_404(prod_id)
+        apply_updates(product, update_data(), {
+            'wattage': required_text,
+            'order': int,
+            'availability': availability_value,
+            'category_id': existing_id(ProductCategory),
+        })
+        db.session.commit()
+        return jsonify({'success': True})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route("/admin/product/<int:prod_id>/update-availability", methods=["POST"])
+def update_product_availability(prod_id):
+    if "admin" not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    
+    try:
+        product = Product.query.get_or_404(prod_id)
+        product.availability = availability_value(request.form.get("availability"))
+        db.session.commit()
+        return jsonify({'success': True})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route("/admin/document/<int:doc_id>/update", methods=["POST", "PATCH"])
+def update_document(doc_id):
+    if "admin" not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    
+    try:
+        document = Document.query.get_or_404(doc_id)
+        data = update_data()
+        apply_updates(document, data, {'order': int, 'product_id': existing_id(Product)})
+        apply_document_updates(document, data)
+        db.session.commit()
+        return jsonify({'success': True})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route("/admin/company-doc/<int:doc_id>/update", methods=["POST", "PATCH"])
+def update_company_doc(doc_id):
+    if "admin" not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    
+    try:
+        doc = CompanyDocument.query.get_or_404(doc_id)
+        data = update_data()
+        apply_updates(doc, data, {'location': required_text})
+        apply_document_updates(doc, data)
+        db.session.commit()
+        return jsonify({'success': True})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
+
+# Reordering takes the complete new order for the categories, or for the
+# products of one category / documents of one product, as
+#   {"kind": "products", "parent_id": 3, "order": [12, 9, 10]}
+# and writes it with one executemany in a single transaction.
+REORDER_KINDS = {
+    # kind: (table, parent column)
+    'categories': (ProductCategory.__table__, None),
+    'products': (Product.__table__, 'category_id'),
+    'documents': (Document.__table__, 'product_id'),
+}
+
+@app.route("/admin/reorder", methods=["POST"])
+def reorder_catalog():
+    if "admin" not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    
+    try:
+        data = request.get_json(silent=True) or {}
+        if data.get('kind') not in REORDER_KINDS:
+            return jsonify({'success': False, 'error': f"kind must be one of {', '.join(REORDER_KINDS)}"})
+        table, parent_column = REORDER_KINDS[data['kind']]
+        ids = [int(item_id) for item_id in data.get('order') or []]
+        
+        scope = []
+        if parent_column:
+            scope.append(table.c[parent_column] == int(data.get('parent_id')))
+        current = dict(db.session.execute(db.select(table.c.id, table.c.order).where(*scope)).all())
+        if len(ids) != len(set(ids)) or set(ids) != set(current):
+            return jsonify({'success': False, 'error': 'Order must list every item exactly once'})
+        
+        # Rows already in place are skipped so the change log and search
+        # index triggers only fire for items that actually moved
+        moved = [{'item_id': item_id, 'position': position}
+                 for position, item_id in enumerate(ids, 1) if current[item_id] != position]
+        if moved:
+            stmt = (table.update()
+                    .where(table.c.id == db.bindparam('item_id'), *scope)
+                    .values(order=db.bindparam('position')))
+            db.session.execute(stmt, moved)
+            mark_tables_changed(table.name)
+        db.session.commit()
+        return jsonify({'success': True, 'moved': len(moved)})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
+
+# ==================== NOTIFICATION MANAGEMENT ====================
+@app.route("/admin/notifications")
+def admin_notifications():
+    if "admin" not in session:
+        return redirect(url_for("admin_login"))
+    return render_template("admin_notifications.html")
+
+@app.route("/admin/notification/add", methods=["POST"])
+def add_notification():
+    if "admin" not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    
+    try:
+        title = request.form.get("title")
+        description = request.form.get("description", "")
+        notification_type = request.form.get("notification_type", "announcement")
+        order = int(request.form.get("order", 0))
+        
+        if not title:
+            return jsonify({'success': False, 'error': 'Title is required'})
+        
+        notification = HomeNotification(title=title, description=description,
+                                        notification_type=notification_type, order=order, is_active=True)
+        db.session.add(notification)
+        db.session.commit()
+        
+        return jsonify({'success': True, 'id': notification.id})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route("/admin/notification/<int:notif_id>/toggle", methods=["POST"])
+def toggle_notification(notif_id):
+    if "admin" not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    
+    try:
+        notification = HomeNotification.query.get_or_404(notif_id)
+        notification.is_active = not notification.is_active
+        db.session.commit()
+        return jsonify({'success': True, 'is_active': notification.is_active})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route("/admin/notification/<int:notif_id>/delete", methods=["POST"])
+def delete_notification(notif_id):
+    if "admin" not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    
+    try:
+        notification = HomeNotification.query.get_or_404(notif_id)
+        db.session.delete(notification)
+        db.session.commit()
+        return jsonify({'success': True})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
+
 @app.route("/admin/logout")
 def admin_logout():
     session.pop("admin", None)
     return redirect(url_for("index"))
 
+# ==================== ADMIN EXPORTS ====================
+# Exports are streamed: rows are fetched from the database in batches of
+# EXPORT_BATCH_SIZE and written out as they arrive, so memory stays flat and
+# the first bytes go out immediately regardless of table size.
+EXPORT_BATCH_SIZE = 1000
+
+def parse_export_date(value):
+    """Parse a YYYY-MM-DD query parameter, returning None when absent"""
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d')
+
+def export_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def stream_export(stmt, columns, fmt):
+    """Yield CSV or NDJSON chunks for `stmt`, one chunk per fetched batch"""
+    result = db.session.execute(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == 'csv':
+        writer.writerow(columns)
+    for batch in result.partitions():
+        for row in batch:
+            values = [export_value(v) for v in row]
+            if fmt == 'csv':
+                writer.writerow(values)
+            else:
+                buffer.write(json.dumps(dict(zip(columns, values)), default=str))
+                buffer.write('\n')
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if fmt == 'csv' and buffer.tell():
+        yield buffer.getvalue()
+
+def export_response(stmt, columns, fmt, name):
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    filename = f"{name}-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.{fmt}"
+    return Response(
+        stream_with_context(stream_export(stmt, columns, fmt)),
+        mimetype=mimetype,
+        headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'X-Accel-Buffering': 'no',
+        },
+    )
+
+@app.route("/admin/export/users.<any(csv, ndjson):fmt>")
+def export_users(fmt):
+    if "admin" not in session:
+        return redirect(url_for("admin_login"))
+    
+    columns = ['id', 'name', 'company', 'email', 'mobile', 'approved']
+    stmt = db.select(User.id, User.name, User.company, User.email, User.mobile, User.approved).order_by(User.id)
+    
+    approved = request.args.get("approved")
+    if approved is not None:
+        stmt = stmt.where(User.approved == (approved.lower() in ('1', 'true', 'yes')))
+    
+    return export_response(stmt, columns, fmt, 'users')
+
+@app.route("/admin/export/access-log.<any(csv, ndjson):fmt>")
+def export_access_log(fmt):
+    if "admin" not in session:
+        return redirect(url_for("admin_login"))
+    
+    try:
+        start = parse_export_date(request.args.get("start"))
+        end = parse_export_date(request.args.get("end"))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Dates must be in YYYY-MM-DD format'}), 400
+    
+    columns = ['id', 'created_at', 'request_type', 'user_id', 'email', 'details', 'notified']
+    stmt = db.select(
+        AccessRequest.id, AccessRequest.created_at, AccessRequest.request_type,
+        AccessRequest.user_id, User.email, AccessRequest.details, AccessRequest.notified
+    ).outerjoin(User, User.id == AccessRequest.user_id).order_by(AccessRequest.id)
+    
+    if start:
+        stmt = stmt.where(AccessRequest.created_at >= start)
+    if end:
+        stmt = stmt.where(AccessRequest.created_at < end + timedelta(days=1))
+    request_types = request.args.getlist("request_type")
+    if request_types:
+        stmt = stmt.where(AccessRequest.request_type.in_(request_types))
+    
+    return export_response(stmt, columns, fmt, 'access-log')
+
+# ==================== LIVE ADMIN EVENTS ====================
+# SQLite triggers record new access requests, user approvals/removals and
+# notification changes in admin_event, in the same transaction as the write
+# and whichever worker made it. Each worker runs one poller thread (only
+# while someone is connected) that reads new rows and fans them out to all of
+# its /admin/events streams, followed by a fresh set of dashboard counts.
+# The row id is the SSE event id, so a reconnecting browser resumes from
+# Last-Event-ID on any worker. If the events it missed are no longer all
+# available (pruned by ADMIN_EVENT_RETENTION or more than SSE_BUFFER_SIZE),
+# it gets a `reset` event instead and should reload its state.
+SSE_MAX_STREAMS = 20
+SSE_POLL_INTERVAL = 1.0
+SSE_HEARTBEAT_SECONDS = 15
+SSE_RETRY_MS = 3000
+SSE_BUFFER_SIZE = 500
+ADMIN_EVENT_RETENTION = 1000
+
+ADMIN_EVENT_DDL = [
+    """CREATE TRIGGER IF NOT EXISTS admin_event_access_request_ai AFTER INSERT ON access_request BEGIN
+        INSERT INTO admin_event(event, data, created_at) VALUES ('access_request',
+            json_object('id', new.id, 'user_id', new.user_id, 'request_type', new.request_type,
+                        'details', new.details, 'created_at', new.created_at), CURRENT_TIMESTAMP);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS admin_event_user_approved AFTER UPDATE OF approved ON user
+    WHEN new.approved AND NOT coalesce(old.approved, 0) BEGIN
+        INSERT INTO admin_event(event, data, created_at) VALUES ('user_approved',
+            json_object('id', new.id, 'name', new.name, 'email', new.email), CURRENT_TIMESTAMP);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS admin_event_user_ad AFTER DELETE ON user BEGIN
+        INSERT INTO admin_event(event, data, created_at) VALUES ('user_removed',
+            json_object('id', old.id, 'email', old.email), CURRENT_TIMESTAMP);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS admin_event_notification_ai AFTER INSERT ON home_notification BEGIN
+        INSERT INTO admin_event(event, data, created_at) VALUES ('notification_added',
+            json_object('id', new.id, 'title', new.title, 'is_active', new.is_active), CURRENT_TIMESTAMP);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS admin_event_notification_toggled AFTER UPDATE OF is_active ON home_notification
+    WHEN new.is_active IS NOT old.is_active BEGIN
+        INSERT INTO admin_event(event, data, created_at) VALUES ('notification_toggled',
+            json_object('id', new.id, 'title', new.title, 'is_active', new.is_active), CURRENT_TIMESTAMP);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS admin_event_notification_ad AFTER DELETE ON home_notification BEGIN
+        INSERT INTO admin_event(event, data, created_at) VALUES ('notification_deleted',
+            json_object('id', old.id, 'title', old.title), CURRENT_TIMESTAMP);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS admin_event_retention AFTER INSERT ON admin_event BEGIN
+        DELETE FROM admin_event WHERE id <= new.id - {ADMIN_EVENT_RETENTION};
+    END""",
+]
+
+def ensure_admin_events():
+    """Create the triggers that feed admin_event"""
+    with db.engine.begin() as conn:
+        for statement in ADMIN_EVENT_DDL:
+            conn.exec_driver_sql(statement)
+
+def latest_admin_event_id():
+    return db.session.execute(db.select(db.func.max(AdminEvent.id))).scalar() or 0
+
+def oldest_admin_event_id():
+    return db.session.execute(db.select(db.func.min(AdminEvent.id))).scalar()
+
+def admin_events_after(event_id, limit=SSE_BUFFER_SIZE):
+    return db.session.execute(
+        db.select(AdminEvent.id, AdminEvent.event, AdminEvent.data)
+        .where(AdminEvent.id > event_id)
+        .order_by(AdminEvent.id)
+        .limit(limit)
+    ).all()
+
+class AdminEventHub:
+    """Per-worker fan-out of admin_event rows to every connected stream"""
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.events = deque(maxlen=SSE_BUFFER_SIZE)
+        self.last_id = 0
+        self.stats = None
+        self.subscribers = 0
+        self.thread = None
+
+    def subscribe(self, last_id):
+        with self.cond:
+            if not self.subscribers:
+                self.last_id = max(self.last_id, last_id)
+            self.subscribers += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._poll, name='admin-events', daemon=True)
+                self.thread.start()
+
+    def unsubscribe(self):
+        with self.cond:
+            self.subscribers -= 1
+
+    def wait(self, after_id, timeout):
+        """Return (events newer than `after_id`, latest stats), waiting up to `timeout`"""
+        with self.cond:
+            if self.last_id <= after_id:
+                self.cond.wait(timeout)
+            return [e for e in self.events if e[0] > after_id], self.stats
+
+    def _poll(self):
+        while True:
+            time.sleep(SSE_POLL_INTERVAL)
+            with self.cond:
+                if not self.subscribers:
+                    continue
+                last_id = self.last_id
+            try:
+                with app.app_context():
+                    rows = [tuple(row) for row in admin_events_after(last_id)]
+                    stats = dashboard_counts() if rows else None
+            except Exception:
+                logging.getLogger('portal').exception('admin_event_poll_failed')
+                continue
+            if rows:
+                with self.cond:
+                    self.events.extend(rows)
+                    self.last_id = rows[-1][0]
+                    self.stats = stats
+                    self.cond.notify_all()
+
+admin_events = AdminEventHub()
+_sse_slots = threading.BoundedSemaphore(SSE_MAX_STREAMS)
+
+def sse_message(name, data, event_id=None):
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines.append(f"event: {name}")
+    lines.extend(f"data: {line}" for line in (data or '').splitlines() or [''])
+    return '\n'.join(lines) + '\n\n'
+
+def generate_admin_events(last_id, backlog, stats, reset):
+    yield f"retry: {SSE_RETRY_MS}\n\n"
+    if reset:
+        yield sse_message('reset', '', last_id)
+    for event_id, name, data in backlog:
+        yield sse_message(name, data, event_id)
+    yield sse_message('stats', json.dumps(stats))
+    while True:
+        events, stats = admin_events.wait(last_id, SSE_HEARTBEAT_SECONDS)
+        if not events:
+            yield ": ping\n\n"
+            continue
+        for event_id, name, data in events:
+            yield sse_message(name, data, event_id)
+            last_id = event_id
+        if stats:
+            yield sse_message('stats', json.dumps(stats))
+
+@app.route("/admin/events")
+def admin_event_stream():
+    if "admin" not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    
+    if not _sse_slots.acquire(blocking=False):
+        return jsonify({'success': False, 'error': 'Too many live connections'}), 503, \
+            {'Retry-After': str(SSE_RETRY_MS // 1000)}
+    
+    try:
+        resume = request.headers.get('Last-Event-ID', type=int)
+        backlog, reset = [], False
+        if resume is not None:
+            backlog = [tuple(row) for row in admin_events_after(resume, SSE_BUFFER_SIZE + 1)]
+            oldest = oldest_admin_event_id()
+            reset = (len(backlog) > SSE_BUFFER_SIZE or (oldest is not None and oldest > resume + 1)
+                     or resume > latest_admin_event_id())
+        if reset:
+            backlog = []
+        # The live loop continues from the last event already sent
+        if backlog:
+            last_id = backlog[-1][0]
+        elif resume is not None and not reset:
+            last_id = resume
+        else:
+            last_id = latest_admin_event_id()
+        stats = cached_dashboard_counts()
+        db.session.close()
+        admin_events.subscribe(last_id)
+    except Exception:
+        _sse_slots.release()
+        raise
+    
+    def close_stream():
+        admin_events.unsubscribe()
+        _sse_slots.release()
+    
+    response = Response(generate_admin_events(last_id, backlog, stats, reset), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(close_stream)
+    return response
+
+# ==================== MEMORY DIAGNOSTICS ====================
+# Admin-only JSON endpoints for chasing memory growth in a running worker:
+# RSS and live object counts by type, tracemalloc start/stop, snapshots and
+# snapshot diffs grouped by allocation site. Every response includes the pid
+# since each request reaches only one worker. With MEMORY_SAMPLE_INTERVAL
+# set (or via the sampler endpoint), a `memory_sample` event is logged to
+# portal.metrics every that many seconds.
+MEMORY_SAMPLE_INTERVAL = 0
+MEMORY_MAX_SNAPSHOTS = 5
+MEMORY_TRACE_FRAMES = 10
+MEMORY_MAX_ROWS = 500
+
+metrics_log = logging.getLogger('portal.metrics')
+_memory_snapshots = {}
+_memory_snapshot_ids = itertools.count(1)
+_memory_sampler = {'thread': None, 'stop': None, 'interval': 0}
+
+def process_memory_kb():
+    """Current and peak resident set size of this process, in KiB"""
+    rss = peak = None
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    rss = int(line.split()[1])
+                elif line.startswith('VmHWM:'):
+                    peak = int(line.split()[1])
+    except OSError:
+        pass
+    if peak is None and resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss, peak
+
+def object_counts(top):
+    """Most common live object types tracked by the garbage collector"""
+    counts = {}
+    for obj in gc.get_objects():
+        name = type(obj).__qualname__
+        counts[name] = counts.get(name, 0) + 1
+    return sorted(counts.items(), key=lambda item: item[1], reverse=True)[:top]
+
+def memory_sample():
+    rss, peak = process_memory_kb()
+    sample = {'pid': os.getpid(), 'rss_kb': rss, 'peak_rss_kb': peak, 'gc_counts': gc.get_count()}
+    if tracemalloc.is_tracing():
+        current, traced_peak = tracemalloc.get_traced_memory()
+        sample['traced_kb'] = current // 1024
+        sample['traced_peak_kb'] = traced_peak // 1024
+    return sample
+
+def start_memory_sampler(interval):
+    """(Re)start logging a memory sample every `interval` seconds; 0 stops it"""
+    if _memory_sampler['stop'] is not None:
+        _memory_sampler['stop'].set()
+    _memory_sampler.update(thread=None, stop=None, interval=interval)
+    if interval <= 0:
+        return
+    stop = threading.Event()
+    
+    def run():
+        while not stop.wait(interval):
+            metrics_log.info('memory_sample', extra=memory_sample())
+    
+    thread = threading.Thread(target=run, name='memory-sampler', daemon=True)
+    _memory_sampler.update(thread=thread, stop=stop)
+    thread.start()
+
+def snapshot_stats(stats, limit):
+    """JSON-friendly tracemalloc Statistic/StatisticDiff entries"""
+    entries = []
+    for stat in stats[:limit]:
+        entry = {
+            'site': str(stat.traceback[0]) if stat.traceback else '?',
+            'size_kb': round(stat.size / 1024, 1),
+            'count': stat.count
+        }
+        if isinstance(stat, tracemalloc.StatisticDiff):
+            entry['size_diff_kb'] = round(stat.size_diff / 1024, 1)
+            entry['count_diff'] = stat.count_diff
+        entries.append(entry)
+    return entries
+
+@app.route("/admin/diagnostics/memory")
+def memory_diagnostics():
+    if "admin" not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    
+    top = max(1, min(request.args.get("top", 25, type=int), MEMORY_MAX_ROWS))
+    return jsonify({
+        **memory_sample(),
+        'tracing': tracemalloc.is_tracing(),
+        'objects': object_counts(top),
+        'snapshots': sorted(_memory_snapshots),
+        'sample_interval': _memory_sampler['interval']
+    })
+
+@app.route("/admin/diagnostics/tracemalloc/<any(start, stop):action>", methods=["POST"])
+def memory_tracing(action):
+    if "admin" not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    
+    if action == 'start':
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(max(1, min(request.form.get("frames", MEMORY_TRACE_FRAMES, type=int), 65535)))
+    else:
+        tracemalloc.stop()
+        _memory_snapshots.clear()
+    return jsonify({'success': True, 'pid': os.getpid(), 'tracing': tracemalloc.is_tracing()})
+
+@app.route("/admin/diagnostics/snapshots", methods=["POST"])
+def take_memory_snapshot():
+    if "admin" not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    if not tracemalloc.is_tracing():
+        return jsonify({'success': False, 'error': 'tracemalloc is not running'}), 409
+    
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ])
+    snapshot_id = next(_memory_snapshot_ids)
+    _memory_snapshots[snapshot_id] = snapshot
+    while len(_memory_snapshots) > MEMORY_MAX_SNAPSHOTS:
+        del _memory_snapshots[min(_memory_snapshots)]
+    
+    limit = max(1, min(request.args.get("limit", 20, type=int), MEMORY_MAX_ROWS))
+    return jsonify({
+        'success': True,
+        'pid': os.getpid(),
+        'id': snapshot_id,
+        'top': snapshot_stats(snapshot.statistics('lineno'), limit)
+    })
+
+@app.route("/admin/diagnostics/snapshots/<int:old_id>/diff/<int:new_id>")
+def diff_memory_snapshots(old_id, new_id):
+    if "admin" not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    if old_id not in _memory_snapshots or new_id not in _memory_snapshots:
+        return jsonify({'success': False, 'error': 'Unknown snapshot for this worker', 'pid': os.getpid()}), 404
+    
+    group_by = request.args.get("group_by", "lineno")
+    if group_by not in ('lineno', 'filename', 'traceback'):
+        group_by = 'lineno'
+    limit = max(1, min(request.args.get("limit", 20, type=int), MEMORY_MAX_ROWS))
+    stats = _memory_snapshots[new_id].compare_to(_memory_snapshots[old_id], group_by)
+    return jsonify({
+        'success': True,
+        'pid': os.getpid(),
+        'diff': snapshot_stats(stats, limit)
+    })
+
+@app.route("/admin/diagnostics/sampler", methods=["POST"])
+def memory_sampler():
+    if "admin" not in session:
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    
+    interval = request.form.get("interval", 0, type=float)
+    start_memory_sampler(interval)
+    return jsonify({'success': True, 'pid': os.getpid(), 'interval': interval})
+
+if MEMORY_SAMPLE_INTERVAL:
+    start_memory_sampler(MEMORY_SAMPLE_INTERVAL)
+
 # ==================== API ENDPOINTS ====================
 @app.route("/api/notifications")
 def api_notifications():
-    notifications = HomeNotification.query.filter_by(is_active=True).order_by(HomeNotification.order).all()
-    return jsonify([{
-        'id': n.id,
-        'title': n.title,
-        'description': n.description,
-        'type': n.notification_type
-    } for n in notifications])
+    return jsonify(fetch_active_notifications())
 
 @app.route("/contact-info")
 def contact_info():
@@ -972,6 +2558,722 @@ def contact_info():
         'website': 'www.gautamsolar.com'
     })
 
+# ==================== CATALOG SEARCH ====================
+# `catalog_fts` is an FTS5 index over categories, products, documents and
+# company documents. Each entry's rowid encodes the source row as
+# id * 4 + kind, and SQLite triggers keep it in sync with every write to the
+# catalog tables (including ORM cascade deletes), so admin routes need no
+# extra code to maintain it.
+SEARCH_KINDS = ('category', 'product', 'document', 'company')
+SEARCH_MAX_TERMS = 8
+SEARCH_DEFAULT_LIMIT = 20
+
+SEARCH_ROWS = {
+    'category': "SELECT c.id * 4, c.name, coalesce(c.description, '') FROM product_category c",
+    'product': "SELECT p.id * 4 + 1, p.wattage, c.name || ' ' || coalesce(c.description, '') "
+               "FROM product p JOIN product_category c ON c.id = p.category_id",
+    'document': "SELECT d.id * 4 + 2, d.doc_type || ' ' || coalesce(d.doc_name, ''), p.wattage || ' ' || c.name "
+                "FROM document d JOIN product p ON p.id = d.product_id JOIN product_category c ON c.id = p.category_id",
+    'company': "SELECT cd.id * 4 + 3, cd.doc_type || ' ' || coalesce(cd.doc_name, ''), cd.location "
+               "FROM company_document cd",
+}
+
+def _fts_insert(kind, where):
+    return f"INSERT INTO catalog_fts(rowid, name, context) {SEARCH_ROWS[kind]} WHERE {where};"
+
+def _fts_delete(rowids):
+    return f"DELETE FROM catalog_fts WHERE rowid IN ({rowids});"
+
+SEARCH_INDEX_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS catalog_fts USING fts5("
+    "name, context, tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+
+    f"""CREATE TRIGGER IF NOT EXISTS catalog_fts_category_ai AFTER INSERT ON product_category BEGIN
+        {_fts_insert('category', 'c.id = new.id')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS catalog_fts_category_au AFTER UPDATE OF name, description ON product_category BEGIN
+        {_fts_delete('old.id * 4')}
+        {_fts_insert('category', 'c.id = new.id')}
+        {_fts_delete('SELECT id * 4 + 1 FROM product WHERE category_id = new.id')}
+        {_fts_insert('product', 'p.category_id = new.id')}
+        {_fts_delete('SELECT d.id * 4 + 2 FROM document d JOIN product p ON p.id = d.product_id WHERE p.category_id = new.id')}
+        {_fts_insert('document', 'p.category_id = new.id')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS catalog_fts_category_ad AFTER DELETE ON product_category BEGIN
+        {_fts_delete('old.id * 4')}
+    END""",
+
+    f"""CREATE TRIGGER IF NOT EXISTS catalog_fts_product_ai AFTER INSERT ON product BEGIN
+        {_fts_insert('product', 'p.id = new.id')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS catalog_fts_product_au AFTER UPDATE OF wattage, category_id ON product BEGIN
+        {_fts_delete('old.id * 4 + 1')}
+        {_fts_insert('product', 'p.id = new.id')}
+        {_fts_delete('SELECT id * 4 + 2 FROM document WHERE product_id = new.id')}
+        {_fts_insert('document', 'p.id = new.id')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS catalog_fts_product_ad AFTER DELETE ON product BEGIN
+        {_fts_delete('old.id * 4 + 1')}
+    END""",
+
+    f"""CREATE TRIGGER IF NOT EXISTS catalog_fts_document_ai AFTER INSERT ON document BEGIN
+        {_fts_insert('document', 'd.id = new.id')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS catalog_fts_document_au AFTER UPDATE OF doc_type, doc_name, product_id ON document BEGIN
+        {_fts_delete('old.id * 4 + 2')}
+        {_fts_insert('document', 'd.id = new.id')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS catalog_fts_document_ad AFTER DELETE ON document BEGIN
+        {_fts_delete('old.id * 4 + 2')}
+    END""",
+
+    f"""CREATE TRIGGER IF NOT EXISTS catalog_fts_company_ai AFTER INSERT ON company_document BEGIN
+        {_fts_insert('company', 'cd.id = new.id')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS catalog_fts_company_au AFTER UPDATE OF location, doc_type, doc_name ON company_document BEGIN
+        {_fts_delete('old.id * 4 + 3')}
+        {_fts_insert('company', 'cd.id = new.id')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS catalog_fts_company_ad AFTER DELETE ON company_document BEGIN
+        {_fts_delete('old.id * 4 + 3')}
+    END""",
+]
+
+def rebuild_search_index(conn):
+    """Repopulate catalog_fts from the catalog tables"""
+    conn.exec_driver_sql("DELETE FROM catalog_fts")
+    for kind in SEARCH_KINDS:
+        conn.exec_driver_sql(_fts_insert(kind, '1').rstrip(';'))
+
+def ensure_search_index():
+    """Create the FTS5 table and its triggers, populating it on first creation"""
+    with db.engine.begin() as conn:
+        exists = conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'catalog_fts'"
+        ).first()
+        for statement in SEARCH_INDEX_DDL:
+            conn.exec_driver_sql(statement)
+        if not exists:
+            rebuild_search_index(conn)
+
+def search_match_query(text):
+    """Turn free text into an FTS5 query that ANDs every term as a prefix"""
+    terms = []
+    for word in re.findall(r'[^\W_]+', text)[:SEARCH_MAX_TERMS]:
+        # "540Wp" should also match the indexed "540 Wp": try the word as
+        # typed or as a phrase split at its digit/letter boundaries
+        parts = re.findall(r'\d+|[^\W\d_]+', word)
+        if len(parts) > 1:
+            terms.append(f'("{word}"* OR "{" ".join(parts)}"*)')
+        else:
+            terms.append(f'"{word}"*')
+    return ' AND '.join(terms)
+
+@app.route("/api/search")
+def api_search():
+    query = request.args.get("q", "").strip()
+    limit = max(1, min(request.args.get("limit", SEARCH_DEFAULT_LIMIT, type=int), 100))
+    is_logged_in = "user_id" in session
+    
+    match = search_match_query(query)
+    if not match:
+        return jsonify({'query': query, 'results': []})
+    
+    rows = db.session.execute(db.text(
+        "SELECT rowid, name, context FROM catalog_fts "
+        "WHERE catalog_fts MATCH :match ORDER BY bm25(catalog_fts, 4.0, 1.0) LIMIT :limit"
+    ), {'match': match, 'limit': limit})
+    
+    results = []
+    for rowid, name, context in rows:
+        kind = SEARCH_KINDS[rowid % 4]
+        item_id = rowid // 4
+        link = None
+        if kind == 'document':
+            link = f'/download/{item_id}' if is_logged_in else '/login'
+        elif kind == 'company':
+            link = f'/download/company/{item_id}' if is_logged_in else '/login'
+        results.append({
+            'id': item_id,
+            'kind': kind,
+            'title': name.strip(),
+            'context': context.strip(),
+            'link': link,
+            'requires_login': link is not None and not is_logged_in
+        })
+    
+    return jsonify({'query': query, 'results': results})
+
+# ==================== CATALOG CHANGE LOG ====================
+# Triggers append one catalog_change row per insert, update or delete on the
+# catalog tables. The row id is a monotonically increasing sequence number
+# (AUTOINCREMENT never reuses ids), which /api/portal-data?since=<seq> uses to
+# return only what changed. A trigger keeps only the newest
+# CATALOG_CHANGE_RETENTION rows (`flask compact-catalog-changes` can trim
+# further); clients behind the oldest retained row get a full snapshot
+# (`full: true`) instead. Document links depend on the login
+# state, so clients should resync from scratch after logging in or out.
+CATALOG_CHANGE_RETENTION = 5000
+
+CATALOG_ENTITIES = {
+    'product_category': 'categories',
+    'product': 'products',
+    'document': 'documents',
+    'company_document': 'companyDocs',
+}
+
+def _change_log_triggers():
+    statements = []
+    for table, entity in CATALOG_ENTITIES.items():
+        for suffix, action, ref, op in (('ai', 'INSERT', 'new', 'upsert'),
+                                        ('au', 'UPDATE', 'new', 'upsert'),
+                                        ('ad', 'DELETE', 'old', 'delete')):
+            statements.append(
+                f"CREATE TRIGGER IF NOT EXISTS catalog_change_{table}_{suffix} AFTER {action} ON {table} BEGIN "
+                f"INSERT INTO catalog_change(entity, entity_id, op, created_at) "
+                f"VALUES ('{entity}', {ref}.id, '{op}', CURRENT_TIMESTAMP); END"
+            )
+    statements.append(
+        f"CREATE TRIGGER IF NOT EXISTS catalog_change_retention AFTER INSERT ON catalog_change BEGIN "
+        f"DELETE FROM catalog_change WHERE id <= new.id - {CATALOG_CHANGE_RETENTION}; END"
+    )
+    return statements
+
+CHANGE_LOG_DDL = _change_log_triggers()
+
+def ensure_change_log():
+    """Create the triggers that feed catalog_change"""
+    with db.engine.begin() as conn:
+        for statement in CHANGE_LOG_DDL:
+            conn.exec_driver_sql(statement)
+
+def current_catalog_seq():
+    """Sequence number of the latest catalog change (0 if there are none)"""
+    return db.session.execute(db.select(db.func.max(CatalogChange.id))).scalar() or 0
+
+def compact_catalog_changes(keep=CATALOG_CHANGE_RETENTION):
+    """Delete all but the newest `keep` change log rows"""
+    cutoff = current_catalog_seq() - keep
+    if cutoff <= 0:
+        return 0
+    deleted = CatalogChange.query.filter(CatalogChange.id <= cutoff).delete()
+    db.session.commit()
+    return deleted
+
+def build_portal_delta(since, is_logged_in):
+    """Entities changed after `since`, or None if a full snapshot is needed"""
+    oldest, latest = db.session.execute(
+        db.select(db.func.min(CatalogChange.id), db.func.max(CatalogChange.id))
+    ).one()
+    latest = latest or 0
+    if since > latest or (oldest is not None and since < oldest - 1) or (oldest is None and since < latest):
+        return None
+    
+    changes = db.session.execute(
+        db.select(CatalogChange.id, CatalogChange.entity, CatalogChange.entity_id, CatalogChange.op)
+        .where(CatalogChange.id > since)
+        .order_by(CatalogChange.id)
+    ).all()
+    
+    # Only the last operation per entity matters
+    last_op = {}
+    for seq, entity, entity_id, op in changes:
+        last_op[(entity, entity_id)] = op
+    upserts = {entity: set() for entity in CATALOG_ENTITIES.values()}
+    for (entity, entity_id), op in last_op.items():
+        if op == 'upsert':
+            upserts[entity].add(entity_id)
+    
+    changed = {
+        'categories': [{
+            'id': c.id,
+            'name': c.name,
+            'description': c.description,
+            'order': c.order
+        } for c in ProductCategory.query.filter(ProductCategory.id.in_(upserts['categories']))],
+        'products': [{
+            'id': p.id,
+            'category_id': p.category_id,
+            'wattage': p.wattage,
+            'availability': p.availability,
+            'order': p.order
+        } for p in Product.query.filter(Product.id.in_(upserts['products']))],
+        'documents': [{
+            'id': d.id,
+            'product_id': d.product_id,
+            'type': d.doc_type,
+            'name': d.doc_name or d.doc_type,
+            'link': f'/download/{d.id}' if is_logged_in else '/login',
+            'requires_login': not is_logged_in,
+            'order': d.order
+        } for d in Document.query.filter(Document.id.in_(upserts['documents']))],
+        'companyDocs': [{
+            'id': d.id,
+            'location': d.location,
+            'type': d.doc_type,
+            'name': d.doc_name or d.doc_type,
+            'link': f'/download/company/{d.id}' if is_logged_in else '/login',
+            'requires_login': not is_logged_in
+        } for d in CompanyDocument.query.filter(CompanyDocument.id.in_(upserts['companyDocs']))],
+    }
+    
+    # Deleted rows, plus upserted rows that have since disappeared
+    present = {entity: {item['id'] for item in items} for entity, items in changed.items()}
+    deleted = {entity: [] for entity in CATALOG_ENTITIES.values()}
+    for entity, entity_id in sorted(last_op):
+        if entity_id not in present[entity]:
+            deleted[entity].append(entity_id)
+    
+    return {
+        'seq': changes[-1][0] if changes else since,
+        'since': since,
+        'full': False,
+        'isLoggedIn': is_logged_in,
+        'changes': changed,
+        'deleted': deleted
+    }
+
+@app.cli.command("compact-catalog-changes")
+@click.option("--keep", default=CATALOG_CHANGE_RETENTION, show_default=True,
+              help="Number of most recent changes to retain.")
+def compact_catalog_changes_command(keep):
+    """Drop old catalog change log entries."""
+    deleted = compact_catalog_changes(keep)
+    print(f"✓ Removed {deleted} catalog change entries")
+
+# ==================== STATIC PRE-RENDER ====================
+# `flask prerender` renders the anonymous versions of the public pages and
+# JSON endpoints into PRERENDER_DIR, each with .gz (and .br when the brotli
+# package is installed) siblings. Once that directory exists, commits that
+# touch the tables a page depends on re-render just those pages in a
+# background thread; files whose content did not change are left alone.
+# A front proxy can then answer requests without a `session` cookie on its
+# own, e.g. nginx with `gzip_static on;` and a rewrite of /about to
+# /prerendered/about.html when $cookie_session is empty.
+PRERENDER_DIR = os.path.join(basedir, 'prerendered')
+PRERENDER_PAGES = {
+    '/': 'index.html',
+    '/about': 'about.html',
+    '/contact': 'contact.html',
+    '/contact-info': 'contact-info.json',
+    '/api/notifications': 'api/notifications.json',
+    '/api/portal-data': 'api/portal-data.json',
+}
+PRERENDER_DEPENDENCIES = {
+    'home_notification': ['/', '/api/notifications'],
+    'product_category': ['/api/portal-data'],
+    'product': ['/api/portal-data'],
+    'document': ['/api/portal-data'],
+    'company_document': ['/api/portal-data'],
+}
+
+prerender_log = logging.getLogger('portal.prerender')
+_prerender_lock = threading.Lock()
+_prerender_pending = set()
+_prerender_thread = None
+
+def file_matches(path, data):
+    try:
+        with open(path, 'rb') as f:
+            return f.read() == data
+    except FileNotFoundError:
+        return False
+
+def write_if_changed(path, data):
+    """Atomically replace `path` with `data`; returns False if it was already identical"""
+    if file_matches(path, data):
+        return False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return True
+
+def prerender_pages(urls=None):
+    """Render `urls` (default: all PRERENDER_PAGES) and return the files rewritten"""
+    written = []
+    client = app.test_client()
+    compressors = [('.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        compressors.append(('.br', brotli.compress))
+    for url in sorted(urls or PRERENDER_PAGES):
+        response = client.get(url)
+        if response.status_code != 200:
+            prerender_log.warning('prerender_failed', extra={'url': url, 'status': response.status_code})
+            continue
+        path = os.path.join(PRERENDER_DIR, PRERENDER_PAGES[url])
+        data = response.get_data()
+        changed = not file_matches(path, data)
+        # Compressed copies go first: if we stop part-way the plain file is
+        # still stale, and the next run rewrites all of them
+        for suffix, compress in compressors:
+            if changed or not os.path.exists(path + suffix):
+                write_if_changed(path + suffix, compress(data))
+        if changed:
+            write_if_changed(path, data)
+            written.append(PRERENDER_PAGES[url])
+    if written:
+        prerender_log.info('prerendered', extra={'files': written})
+    return written
+
+def _prerender_worker():
+    global _prerender_thread
+    while True:
+        with _prerender_lock:
+            urls = set(_prerender_pending)
+            _prerender_pending.clear()
+            if not urls:
+                _prerender_thread = None
+                return
+        try:
+            prerender_pages(urls)
+        except Exception:
+            prerender_log.exception('prerender_failed', extra={'urls': sorted(urls)})
+
+def schedule_prerender(urls):
+    """Queue pages for re-rendering on a background thread"""
+    global _prerender_thread
+    with _prerender_lock:
+        _prerender_pending.update(urls)
+        if _prerender_thread is None:
+            _prerender_thread = threading.Thread(target=_prerender_worker, name='prerender', daemon=True)
+            _prerender_thread.start()
+
+@on_tables_changed(*PRERENDER_DEPENDENCIES)
+def prerender_changed_pages(tables):
+    if not os.path.isdir(PRERENDER_DIR):
+        return
+    urls = {url for table in tables for url in PRERENDER_DEPENDENCIES.get(table, ())}
+    if urls:
+        schedule_prerender(urls)
+
+@app.cli.command("prerender")
+def prerender_command():
+    """Write static copies of the public pages into PRERENDER_DIR."""
+    written = prerender_pages()
+    print(f"✓ Pre-rendered {len(written)} file(s) into {PRERENDER_DIR}")
+
+# ==================== TEMPLATE PRELOADING ====================
+# With PRELOAD_TEMPLATES on, every page template is loaded when the module is
+# imported, i.e. before a worker starts serving, so the first requests after a
+# deploy or worker recycle do not pay for parsing and compiling them.
+PRELOAD_TEMPLATES = True
+
+def precompile_templates():
+    """Load every top-level .html template into the Jinja and bytecode caches"""
+    template_dir = os.path.join(app.root_path, app.template_folder)
+    loaded = []
+    for name in sorted(os.listdir(template_dir)):
+        if not name.endswith('.html'):
+            continue
+        try:
+            app.jinja_env.get_template(name)
+            loaded.append(name)
+        except TemplateError as e:
+            logging.getLogger('portal').warning('template_compile_failed', extra={'template': name, 'error': str(e)})
+    return loaded
+
+@app.cli.command("precompile-templates")
+def precompile_templates_command():
+    """Compile all templates into the shared bytecode cache."""
+    loaded = precompile_templates()
+    print(f"✓ Compiled {len(loaded)} template(s) into {TEMPLATE_CACHE_DIR}")
+
+if PRELOAD_TEMPLATES:
+    precompile_templates()
+
+# ==================== BENCHMARKS ====================
+def build_portal_data_orm(is_logged_in):
+    """The original ORM version of build_portal_data, kept as the benchmark baseline"""
+    categories = ProductCategory.query.order_by(ProductCategory.order).all()
+    company_docs = CompanyDocument.query.all()
+    
+    company_data = {}
+    for doc in company_docs:
+        if doc.location not in company_data:
+            company_data[doc.location] = []
+        company_data[doc.location].append({
+            'id': doc.id,
+            'type': doc.doc_type,
+            'name': doc.doc_name or doc.doc_type,
+            'link': f'/download/company/{doc.id}' if is_logged_in else '/login',
+            'requires_login': not is_logged_in
+        })
+    
+    products_data = []
+    for cat in categories:
+        products = Product.query.filter_by(category_id=cat.id).order_by(Product.order).all()
+        products_list = []
+        for prod in products:
+            docs = Document.query.filter_by(product_id=prod.id).order_by(Document.order).all()
+            products_list.append({
+                'id': prod.id,
+                'wattage': prod.wattage,
+                'availability': prod.availability,
+                'documents': [{
+                    'id': d.id,
+                    'type': d.doc_type,
+                    'name': d.doc_name or d.doc_type,
+                    'link': f'/download/{d.id}' if is_logged_in else '/login',
+                    'requires_login': not is_logged_in
+                } for d in docs]
+            })
+        
+        products_data.append({
+            'id': cat.id,
+            'name': cat.name,
+            'description': cat.description,
+            'products': products_list
+        })
+    
+    return {
+        'companyDocs': company_data,
+        'categories': products_data,
+        'isLoggedIn': is_logged_in
+    }
+
+def benchmark_portal_data(rounds):
+    """Time and trace allocations of the Core and ORM catalog builders plus serialization"""
+    results = {}
+    for label, builder in (('orm', build_portal_data_orm), ('core', build_portal_data)):
+        builder(True)
+        db.session.expunge_all()
+        started = time.perf_counter()
+        for _ in range(rounds):
+            app.json.dumps(builder(True))
+            db.session.expunge_all()
+        elapsed = (time.perf_counter() - started) / rounds
+        
+        tracemalloc.start()
+        app.json.dumps(builder(True))
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        db.session.expunge_all()
+        results[label] = {'ms': elapsed * 1000, 'peak_kb': peak / 1024}
+    return results
+
+def seed_benchmark_catalog(categories, products, documents):
+    """Fill the current database with a synthetic catalog"""
+    for c in range(categories):
+        category = ProductCategory(name=f"Category {c}", description=f"Benchmark category {c}", order=c)
+        db.session.add(category)
+        db.session.flush()
+        for p in range(products):
+            product = Product(category_id=category.id, wattage=f"{400 + p * 5} Wp", order=p)
+            db.session.add(product)
+            db.session.flush()
+            db.session.add_all([Document(product_id=product.id, doc_type=f"Certificate {d}", doc_name=f"Doc {d}",
+                                         download_link="https://example.com/doc.pdf", order=d)
+                                for d in range(documents)])
+    db.session.commit()
+
+@app.cli.command("bench-portal-data")
+@click.option("--rounds", default=20, show_default=True, help="Builds to time per implementation.")
+@click.option("--categories", default=0, help="Benchmark a scratch database with this many synthetic categories.")
+@click.option("--products", default=20, show_default=True, help="Products per synthetic category.")
+@click.option("--documents", default=6, show_default=True, help="Documents per synthetic product.")
+def bench_portal_data_command(rounds, categories, products, documents):
+    """Compare the ORM and Core builders for /api/portal-data."""
+    if categories:
+        scratch_dir = tempfile.mkdtemp()
+        bench_app = Flask(__name__)
+        bench_app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(scratch_dir, 'bench.db')}"
+        db.init_app(bench_app)
+        context = bench_app.app_context()
+    else:
+        context = app.app_context()
+    
+    with context:
+        if categories:
+            db.create_all()
+            seed_benchmark_catalog(categories, products, documents)
+        results = benchmark_portal_data(rounds)
+    
+    print(f"JSON encoder: {'orjson' if orjson else 'stdlib json'}")
+    for label, result in results.items():
+        print(f"  {label:<5} {result['ms']:8.2f} ms/request   peak {result['peak_kb']:9.1f} KiB")
+    print(f"  speedup {results['orm']['ms'] / results['core']['ms']:.1f}x")
+
+# ==================== DATABASE BACKUPS ====================
+# Backups use SQLite's online backup API, copying BACKUP_PAGES_PER_STEP pages
+# at a time and sleeping in between so writers only ever wait for one short
+# step. A write from another connection makes SQLite restart the copy; after
+# BACKUP_MAX_RESTARTS of those the attempt is abandoned. In WAL mode the copy
+# is then finished in a single step, which only holds a read transaction and
+# so does not block writers; otherwise it is retried after a back-off, up to
+# BACKUP_MAX_ATTEMPTS times.
+# Every copy is integrity-checked before it is gzipped into BACKUP_DIR, and
+# only the newest BACKUP_KEEP archives are kept.
+#
+# With BACKUP_INTERVAL_HOURS set, every worker checks every few minutes
+# whether the newest archive is older than that; a lock file makes sure only
+# one of them takes the backup.
+BACKUP_DIR = os.path.join(basedir, 'database', 'backups')
+BACKUP_PREFIX = 'certportal-'
+BACKUP_KEEP = 14
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_SLEEP = 0.05
+BACKUP_MAX_RESTARTS = 5
+BACKUP_MAX_ATTEMPTS = 4
+BACKUP_RETRY_DELAY = 30
+BACKUP_INTERVAL_HOURS = 0
+BACKUP_CHECK_SECONDS = 300
+
+backup_log = logging.getLogger('portal.backup')
+
+check_private_dir(BACKUP_DIR)
+
+def make_backup_dir():
+    """Create BACKUP_DIR readable by the app user only; archives hold every password hash"""
+    os.makedirs(BACKUP_DIR, mode=0o700, exist_ok=True)
+    os.chmod(BACKUP_DIR, 0o700)
+
+class BackupRestarted(Exception):
+    pass
+
+def copy_database(src_path, dst_path, pages=BACKUP_PAGES_PER_STEP):
+    """Copy a live SQLite database with the online backup API and integrity-check the result"""
+    restarts = 0
+    last_remaining = None
+    
+    def progress(status, remaining, total):
+        nonlocal restarts, last_remaining
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > BACKUP_MAX_RESTARTS:
+                raise BackupRestarted()
+        last_remaining = remaining
+        # sqlite3 only sleeps between steps when the source is busy; pause
+        # here so writers get the database between every step
+        if remaining:
+            time.sleep(BACKUP_STEP_SLEEP)
+    
+    src = sqlite3.connect(src_path, timeout=30)
+    dst = sqlite3.connect(dst_path)
+    try:
+        wal = src.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        for attempt in range(1, BACKUP_MAX_ATTEMPTS + 1):
+            restarts = 0
+            last_remaining = None
+            try:
+                src.backup(dst, pages=pages, progress=progress)
+                break
+            except BackupRestarted:
+                if wal:
+                    backup_log.warning('backup_single_step', extra={'restarts': restarts})
+                    src.backup(dst, pages=-1)
+                    break
+                if attempt == BACKUP_MAX_ATTEMPTS:
+                    raise RuntimeError(f"Backup kept restarting under concurrent writes ({attempt} attempts)")
+                backup_log.warning('backup_retry', extra={'attempt': attempt, 'restarts': restarts})
+                time.sleep(BACKUP_RETRY_DELAY * attempt)
+        result = dst.execute("PRAGMA integrity_check").fetchone()[0]
+    finally:
+        src.close()
+        dst.close()
+    if result != 'ok':
+        raise RuntimeError(f"Integrity check failed for {dst_path}: {result}")
+
+def list_backups():
+    """Backup archives in BACKUP_DIR, oldest first"""
+    if not os.path.isdir(BACKUP_DIR):
+        return []
+    return sorted(os.path.join(BACKUP_DIR, name) for name in os.listdir(BACKUP_DIR)
+                  if name.startswith(BACKUP_PREFIX) and name.endswith('.db.gz'))
+
+def backup_database():
+    """Write a compressed, verified snapshot of the live database and rotate old ones"""
+    make_backup_dir()
+    started = time.monotonic()
+    stamp = datetime.utcnow().strftime('%Y%m%d-%H%M%S-%f')
+    archive = os.path.join(BACKUP_DIR, f"{BACKUP_PREFIX}{stamp}.db.gz")
+    
+    fd, tmp_db = tempfile.mkstemp(dir=BACKUP_DIR, suffix='.db')
+    os.close(fd)
+    tmp_archive = archive + '.part'
+    try:
+        copy_database(db_path, tmp_db)
+        archive_fd = os.open(tmp_archive, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with open(tmp_db, 'rb') as src, open(archive_fd, 'wb') as raw, \
+                gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        os.replace(tmp_archive, archive)
+    finally:
+        for path in (tmp_db, tmp_archive):
+            if os.path.exists(path):
+                os.remove(path)
+    
+    for old in list_backups()[:-BACKUP_KEEP]:
+        os.remove(old)
+    
+    backup_log.info('backup_written', extra={'archive': archive, 'bytes': os.path.getsize(archive),
+                                             'seconds': round(time.monotonic() - started, 2)})
+    return archive
+
+def restore_database(archive):
+    """Replace the live database contents with a backup archive, saving the current state first"""
+    make_backup_dir()
+    fd, tmp_db = tempfile.mkstemp(dir=BACKUP_DIR, suffix='.db')
+    os.close(fd)
+    try:
+        with gzip.open(archive, 'rb') as src, open(tmp_db, 'wb') as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        check = sqlite3.connect(tmp_db)
+        try:
+            result = check.execute("PRAGMA integrity_check").fetchone()[0]
+        finally:
+            check.close()
+        if result != 'ok':
+            raise RuntimeError(f"Integrity check failed for {archive}: {result}")
+        
+        safety_copy = backup_database()
+        copy_database(tmp_db, db_path, pages=-1)
+    finally:
+        os.remove(tmp_db)
+    
+    backup_log.info('backup_restored', extra={'archive': archive, 'previous_state': safety_copy})
+    return safety_copy
+
+def _scheduled_backups():
+    lock_path = os.path.join(BACKUP_DIR, '.lock')
+    while True:
+        time.sleep(BACKUP_CHECK_SECONDS)
+        backups = list_backups()
+        if backups and time.time() - os.path.getmtime(backups[-1]) < BACKUP_INTERVAL_HOURS * 3600:
+            continue
+        lock = acquire_file_lock(lock_path)
+        if lock is None:
+            continue
+        try:
+            # Another worker may have just finished one
+            backups = list_backups()
+            if not backups or time.time() - os.path.getmtime(backups[-1]) >= BACKUP_INTERVAL_HOURS * 3600:
+                backup_database()
+        except Exception:
+            backup_log.exception('backup_failed')
+        finally:
+            release_file_lock(lock)
+
+@app.cli.command("backup-db")
+def backup_db_command():
+    """Take an online backup of the portal database."""
+    archive = backup_database()
+    print(f"✓ Backup written to {archive}")
+
+@app.cli.command("restore-db")
+@click.argument("archive", type=click.Path(exists=True, dir_okay=False))
+@click.option("--yes", is_flag=True, help="Do not ask for confirmation.")
+def restore_db_command(archive, yes):
+    """Restore the portal database from a backup archive."""
+    if not yes:
+        click.confirm(f"Replace the contents of {db_path} with {archive}?", abort=True)
+    safety_copy = restore_database(archive)
+    print(f"✓ Restored {archive} (previous state saved to {safety_copy})")
+
+if BACKUP_INTERVAL_HOURS:
+    threading.Thread(target=_scheduled_backups, name='db-backup', daemon=True).start()
+
 # ==================== INITIALIZATION ====================
 def init_db():
     with app.app_context():
@@ -995,7 +3297,21 @@ def init_db():
                 conn.commit()
             print("✓ doc_name column added!")
         
+        for table, model in (('document', Document), ('company_document', CompanyDocument)):
+            try:
+                model.query.with_entities(model.file_sha256).first()
+            except:
+                print(f"⚠️  Adding file columns to {table} table...")
+                with db.engine.connect() as conn:
+                    conn.execute(db.text(f"ALTER TABLE {table} ADD COLUMN file_sha256 VARCHAR(64)"))
+                    conn.execute(db.text(f"ALTER TABLE {table} ADD COLUMN file_name VARCHAR(255)"))
+                    conn.commit()
+                print("✓ File columns added!")
+        
         db.create_all()
+        ensure_search_index()
+        ensure_change_log()
+        ensure_admin_events()
         print("✓ Database initialized!")
         
         if ProductCategory.query.count() == 0: